@@ -14,12 +14,20 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog
 import pandas as pd
-import seaborn
-import matplotlib.pyplot as plt
 import numpy as np
-from skimage import io
-from tqdm import tqdm
-from matplotlib.colors import to_hex
+from cellStitching import stitchCells, formatData
+from cellRelations import findParents, relateFociToCells
+from areaPlot import plotAreaVsTime
+from cellMetrics import relativeTime, summarizeCells
+from cellProfilerIO import readCellProfilerTable, fociTableColumns, writeTable, writeFeather
+
+#CellProfiler columns the GUI renames before saving
+guiRenamedColumns = {'TrackObjects_Label': 'Lineage',
+                     'AreaShape_Solidity': 'Solidity',
+                     'AreaShape_FormFactor': 'Circularity'}
+#columns the analysis adds to the CellProfiler ones, which can also be picked for the output
+calculatedCellColumns = ['cell ID','AreaShape_Area_um','Aspect Ratio','Shape','Time (hr)','Relative Time','Parent','Parent Area']
+calculatedFociColumns = ['cell ID','AreaShape_Area_um','Aspect Ratio','Shape']
 
 def calculateShape(df,pixelConversion):
     """
@@ -30,212 +38,36 @@ def calculateShape(df,pixelConversion):
     """
     df['AreaShape_Area_um']= df['AreaShape_Area']*(pixelConversion**2)
     df['Aspect Ratio']= df['AreaShape_MajorAxisLength']/df['AreaShape_MinorAxisLength']
-    df['Shape'] = np.where(df['Aspect Ratio'] >= 2, 'rod', 'disk')
+    df['Shape'] = pd.Categorical.from_codes((df['Aspect Ratio'] >= 2).astype(np.int8), categories=['disk','rod'])
     
     return df
 
 
-def findStartingCells(df):
-    """
-    Get the cells that start lineages and splits, and start separating the cells. These are cells with a 'TrackObjects_LinkType' of 0 and 2,
-    respectively. Only one daughter in a division even gets the 'TrackObjects_LinkType' of 2 so to get the other daughter cell we look for the
-    cell that that has a 'TrackObjects_LinkType' of 1 that shares the same parent cell. This function gives of the first frame of all cells-through-time
-    and thus we can give them all a unique 'Cell ID' value.
-
-    This function returns a list of the starting cells found and a modified version of the input dataframe where the starting cells have been removed.
-    """
-    cellID = 1
-    cellList = []
-    
-    lineageStarts = df.loc[(df['TrackObjects_LinkType'] == 0) | (df['TrackObjects_LinkType'] == 2)]
-    
-    for index,row in lineageStarts.iterrows():
-        cell = []
-        cell.append([cellID,row])
-        cellList.append(cell)
-        df = df.drop(index)
-        cellID += 1
-    for i in tqdm(range(len(cellList))):
-        if cellList[i][-1][1]['TrackObjects_LinkType'] == 2:
-            splitFrame = cellList[i][-1][1]['ImageNumber']
-            splitParent = cellList[i][-1][1]['TrackObjects_ParentObjectNumber']
-            otherDaughter = df.loc[(df['ImageNumber']==splitFrame) &
-                                       (df['TrackObjects_ParentObjectNumber']==splitParent) & 
-                                       (df['TrackObjects_LinkType'] == 1)]
-            #for some reason the length of this .loc is sometimes 0, i think its because cells are moving
-            for index,row in otherDaughter.iterrows():
-                newCell = []
-                newCell.append([cellID,row])
-                cellList.append(newCell)
-                df = df.drop(index)
-                cellID += 1
-    
- 
-    return cellList, df
-
-
-def findNextCell(df,currentCell):
-    """
-    Now that we have the starting frame for each cell-through-time we can follow that cell frame by frame and connect them by giving all instances
-    of that cell-through-time the same Cell ID number. This is done by recursively calling this function until the end of a track is reached.
-
-    This functions returns a a list of lists containing all instances of a single, cell-through-time.
-    """
-    cellID = currentCell[-1][0]
-    currentFrame = currentCell[-1][1]['ImageNumber']
-    currentObjectNumber = currentCell[-1][1]['ObjectNumber']
-    currentLineage = currentCell[-1][1]['TrackObjects_Label']
-    nextCell = df.loc[(df['TrackObjects_ParentImageNumber']==currentFrame) 
-                      & (df['TrackObjects_ParentObjectNumber']==currentObjectNumber)
-                      & (df['TrackObjects_Label']==currentLineage)]
-    if not nextCell.empty:
-        for index, row in nextCell.iterrows():
-            currentCell.append([cellID,row])
-            df = df.drop(index)
-        findNextCell(df,currentCell)
-        
-    return currentCell
-
-
-def formatData(cellList):
-    """
-    This function takes the list of lists of lists of all the cells-through-time and converts it into a dataframe.
-
-    This function returns the new dataframe containing all the cells-through-time with their unique 'Cell ID' as a new column
-    """
-    data = []
-    for cell in cellList:
-        spots = []
-        for spot in cell:
-            spot[1]['cell ID'] = spot[0]
-            spots.append(spot[1])
-        spots = pd.DataFrame(spots)
-        data.append(spots)
-    data = pd.concat(data)
-    
-    return data
-
-
-def findParents(data):
-    """
-    This function for any given instance of a cell-through-time, finds the parent, or mother, of that instance and records this as a new
-    column in the dataframe. It also records the area of the the parent.
-
-    This function returns this updated version of the dataframe.
-    """
-    parents = []
-    parentsArea = []
-    for index, row in data.iterrows():
-        parentFrame = row['TrackObjects_ParentImageNumber']
-        parentObjectNumber = row['TrackObjects_ParentObjectNumber']
-        parent = data['cell ID'].loc[(data['ImageNumber']==parentFrame) & (data['ObjectNumber']==parentObjectNumber)]
-        parentArea = data['AreaShape_Area_um'].loc[(data['ImageNumber']==parentFrame) & (data['ObjectNumber']==parentObjectNumber)]
-        if parent.empty:
-            parents.append('NaN')
-        else:
-            for index, value in parent.items():
-                parents.append(value)
-        if parentArea.empty:
-            parentsArea.append('NaN')
-        else:
-            for index, value in parentArea.items():
-                parentsArea.append(value)
-    data['Parent'] = parents
-    data['Parent Area'] = parentsArea
-    
-    return data
-
-
-def relativeTiming(group):
-    """
-    This function creates a new column in the dataframe that normalizes the time so that the first instance of all cells-through-time starts
-    at zero.
-
-    This function returns this modified version of the dataframe.
-    """
-    birthTime = group['Time (hr)'].iloc[0]
-    group['Relative Time'] = group['Time (hr)'] - birthTime
-    
-    return group
-
-                 
-def randomColoring(group):
-    color =  to_hex(tuple(np.random.rand(3)))
-    group['randomColor'] = color
-    
-    return group
-
-
 def visualizeTracking(data,outputDirectory,trackImageFileName):
     """
     This function takes the X,Y center points of instances of cells-through-time and draws lines between them and displays it on top of the
     original segmentation '.tif' generated from Omnipose. This allows us to visually assess the quality of the tracking done by CellProfiler
-    since the second LAP tracking phase is never shown to you while CellProfiler runs.
+    since the second LAP tracking phase is never shown to you while CellProfiler runs. The lines are drawn straight into the pixels of the
+    input stack (see trackOverlay.py) so the output lines up with it exactly.
 
     This function saves a new '.tif' stack with the tracks visuallized and returns nothing.
     """
-    cells = data.groupby('cell ID',group_keys=False)
-    data = cells.apply(randomColoring)
-    cells = data.groupby('cell ID')
-    
-    
-    im = io.imread(trackImageFileName)
-    print(im.shape)
-    #frames, heightPixels, widthPixels = im.shape
-    frames, heightPixels, widthPixels, channels = im.shape
-    dpi = 300
-    figSizeInches = (widthPixels / dpi, heightPixels / dpi)
-    stackedFrames = []
-    plt.show()
-    plt.ioff()
-    fig, tx = plt.subplots(dpi=dpi,figsize=figSizeInches)
-    img = tx.imshow(im[0, :, :], cmap='gray')
-    removeLine = False
-    line0 = []
-    for frame in tqdm(range(im.shape[0])):
-        currentFrame = im[frame][:][:]
-        img.set_data(currentFrame)
-        if removeLine:
-            for line in tx.lines:
-                line.remove()
-            fig.canvas.draw()
-        for group, values in cells:
-            if frame > 10:
-                subDF = values.loc[(values['ImageNumber'] >= frame-3)&
-                                   (values['ImageNumber'] <= frame+3)]
-            else:
-                subDF = values.loc[values['ImageNumber'] <= frame] #get 5 frames of information ahead of current frame
-            x = list(subDF['Location_Center_X'])
-            y = list(subDF['Location_Center_Y'])
-            c = values['randomColor'].iloc[0]
-            for i in range(len(x)):
-                if i > 0:
-                    line0, = tx.plot([x[i-1], x[i]], 
-                            [y[i-1], y[i]],
-                            color=c,alpha=0.8)
-                    removeLine = True
-
-        fig.canvas.draw()  # Draw the figure to update the canvas
-        frame = np.array(fig.canvas.renderer.buffer_rgba())[:, :, :3]  # Extract RGB values
-        stackedFrames.append(frame)
-        plt.close()
-    trackingImage = np.stack(stackedFrames)
-    io.imsave(outputDirectory+'tracks.tif', trackingImage)
+    from trackOverlay import drawTracks
+
+    drawTracks(data,trackImageFileName,outputDirectory+'tracks.tif')
     
    
-def relateFociToCells(data,dfFoci):
-    cellIDs = []
-    for i in tqdm(range(dfFoci.shape[0])):
-        frame = dfFoci.iloc[i]['ImageNumber']
-        fociParent = dfFoci.iloc[i]['Parent_FilterCells']
-        cellID = int(data['cell ID'].loc[(data['ImageNumber']==frame) &
-                                       (data['ObjectNumber']==fociParent)])
-        cellIDs.append(cellID)
-    
-    return cellIDs
+def outputColumnChoices(fileName,calculatedColumns,renamedColumns={}):
+    """
+    This function returns the columns that can be picked for the output of a CellProfiler table, read from its header only: the columns of the
+    table (renamed with 'renamedColumns') followed by the 'calculatedColumns' the analysis adds.
+    """
+    columns = [renamedColumns.get(column, column) for column in pd.read_csv(fileName, nrows=0).columns]
+
+    return columns + [column for column in calculatedColumns if column not in columns]
+
 
-def select_columns(dataframe):
-    columns = list(dataframe.columns)
+def select_columns(columns):
     selected_columns = []
 
     def submit_columns():
@@ -302,7 +134,9 @@ def analyzeCPData():
     print('Output Directory: ',outputDirectory)
     
     
-    df = pd.read_csv(inputDirectory+inputCellFileName)
+    #the output columns are picked first so that only the columns needed for them are read
+    outputColumnOrder = select_columns(outputColumnChoices(inputDirectory+inputCellFileName,calculatedCellColumns,guiRenamedColumns))
+    df = readCellProfilerTable(inputDirectory+inputCellFileName,outputColumnOrder)
     df = df.sort_values(by=['ImageNumber']) #sort all data by 'time'
     df = calculateShape(df,pixelConversion)
     df['Time (hr)'] = (df['ImageNumber']-1)*timeInterval
@@ -311,17 +145,12 @@ def analyzeCPData():
     
     print('Finding Cells...')
     if timelapse.get():
-        cellList,df = findStartingCells(df)
-        print('Found!!!')
-    
-    if timelapse.get():
-        data = []
         print('Stiching Mothers and Daughters Through Time...')
-        for i in tqdm(range(len(cellList))):
-            stitchedCell = findNextCell(df,cellList[i])
-            data.append(stitchedCell)
+        cellIDs = stitchCells(df)
+        print('Found!!!')
         print('Formating...')
-        data = formatData(data)
+        data = formatData(df,cellIDs)
+        del df, cellIDs #free the input table, 'data' now holds every connected row
         finalDataDize = data.shape[0]
         #print(finalDataDize)
         try:
@@ -333,20 +162,16 @@ def analyzeCPData():
             print(f"Error: {e}")
    
     
-        cells = data.groupby('cell ID',group_keys=False)
-        data = cells.apply(relativeTiming)
+        data['Relative Time'] = relativeTime(data)
         data = findParents(data)
+        writeTable(summarizeCells(data,pixelConversion),outputDirectory+'cellSummary.csv',outputFormat.get())
+        if outputFormat.get() != 'csv':
+            writeFeather(data,outputDirectory+'stitchedCells.feather')
         print('Tracking Cells...')
         visualizeTracking(data,outputDirectory,trackImageFileName)
         print('Tracked!!!')
-        plt.ion()
         #plot data with time and relative time
-        figure, ax = plt.subplots(dpi=300) 
-        seaborn.scatterplot(data=data,ax=ax,hue='cell ID',
-                   x='Time (hr)',y='AreaShape_Area_um',
-                   edgecolor="k",linewidth=0.75,palette=qualitative_colors,
-                   zorder=1.0)
-        ax.get_legend().set_visible(False)
+        plotAreaVsTime(data,outputDirectory+'areaVsTime.png',qualitative_colors)
     else:
         data = df
         ids = list(range(data.shape[0]))
@@ -354,28 +179,25 @@ def analyzeCPData():
         print('Found!!!')
         
     if foci.get():
-        dfFoci = pd.read_csv(inputFociFileName)
+        fociColumnOrder = select_columns(outputColumnChoices(inputFociFileName,calculatedFociColumns))
+        dfFoci = readCellProfilerTable(inputFociFileName,fociColumnOrder,fociTableColumns)
         dfFoci = calculateShape(dfFoci,pixelConversion)
         print('Assigning Foci to Cells...')
-        cellIDs = relateFociToCells(data,dfFoci)
-        dfFoci['cell ID'] = cellIDs
+        dfFoci['cell ID'] = relateFociToCells(data,dfFoci)
         print('Assigned!!!')
         
         
         
-    data = data.rename(columns={'TrackObjects_Label': 'Lineage'})
-    data = data.rename(columns={'AreaShape_Solidity': 'Solidity'})
-    data = data.rename(columns={'AreaShape_FormFactor': 'Circularity'})
+    data = data.rename(columns=guiRenamedColumns)
     
-    outputColumnOrder = select_columns(data)
-    outputDF = data[outputColumnOrder] 
-    outputDF.to_csv(outputDirectory+outputCellFileName, index=False, header=True)
+    #columns that are only made for a timelapse are left out of other runs
+    outputDF = data[[column for column in outputColumnOrder if column in data]]
+    writeTable(outputDF,outputDirectory+outputCellFileName,outputFormat.get())
     
     if foci.get():
-        outputColumnOrder = select_columns(dfFoci)
-        outputDF = dfFoci[outputColumnOrder]
+        outputDF = dfFoci[[column for column in fociColumnOrder if column in dfFoci]]
         outputDF = outputDF.sort_values(by=['cell ID'])
-        outputDF.to_csv(outputDirectory+outputFociFileName, index=False, header=True)                 
+        writeTable(outputDF,outputDirectory+outputFociFileName,outputFormat.get())
     print('Finished!!!')
     
 def open_file(entry):
@@ -438,77 +260,86 @@ def toggle_additional_entries(checkbox, *entries):
         for entry in entries:
             entry.config(state=state)
     
-root = tk.Tk()
-root.title("Cell Profiler Analysis Variable Input")
-
 #global variables from user
 inputDirectory = ''
 inputCellFileName = ''
 pixelConversion = 0
 timeInterval = 0
-timelapse = tk.BooleanVar()
-foci = tk.BooleanVar()
 outputDirectory = ''
 
 inputFociFileName = ''
 trackImageFileName = ''
-qualitative_colors = seaborn.color_palette("Set3")
+qualitative_colors = "Set3"
 outputCellFileName = 'output_cells.csv'
 outputFociFileName = 'output_foci.csv'
-    
 
-var1_label = tk.Label(root, text="Input Cellular Data File:")
-var1_label.grid(row=0, column=0)
-var1_entry = tk.Entry(root)
-var1_entry.grid(row=0, column=1)
-var1_button = tk.Button(root, text="Select File", command=lambda: open_file(var1_entry))
-var1_button.grid(row=0, column=2)
-
-var2_label = tk.Label(root, text="Pixel Conversion Factor:")
-var2_label.grid(row=1, column=0)
-var2_entry = tk.Entry(root)
-var2_entry.grid(row=1, column=1)
-
-checkbox_label_1 = tk.Label(root, text="Timelapse?")
-checkbox_label_1.grid(row=2, column=0)
-checkbox_1 = tk.Checkbutton(root, text="Yes", variable=timelapse, onvalue=True, offvalue=False,command=lambda: toggle_additional_entries(timelapse, var3_entry,var4_entry))
-checkbox_1.grid(row=2, column=1)
-
-var3_label = tk.Label(root, text="Time Interval:")
-var3_label.grid(row=3, column=0)
-var3_entry = tk.Entry(root, state=tk.DISABLED)
-var3_entry.grid(row=3, column=1)
-
-var4_label = tk.Label(root, text="Track file:")
-var4_label.grid(row=4, column=0)
-var4_entry = tk.Entry(root,state=tk.DISABLED)
-var4_entry.grid(row=4, column=1)
-var4_button = tk.Button(root, text="Select File", command=lambda: open_file(var4_entry))
-var4_button.grid(row=4, column=2)
-
-checkbox_label_2 = tk.Label(root, text="Foci?")
-checkbox_label_2.grid(row=5, column=0)
-checkbox_2 = tk.Checkbutton(root, text="Yes", variable=foci, onvalue=True, offvalue=False,command=lambda: toggle_additional_entries(foci, var5_entry))
-checkbox_2.grid(row=5, column=1)
-
-var5_label = tk.Label(root, text="Input Foci Data File:")
-var5_label.grid(row=6, column=0)
-var5_entry = tk.Entry(root,state=tk.DISABLED)
-var5_entry.grid(row=6, column=1)
-var5_button = tk.Button(root, text="Select File", command=lambda: open_file(var5_entry))
-var5_button.grid(row=6, column=2)
-
-var6_label = tk.Label(root, text="Output Directory:")
-var6_label.grid(row=7, column=0)
-var6_entry = tk.Entry(root)
-var6_entry.grid(row=7, column=1)
-var6_button = tk.Button(root, text="Select Output Directory", command=select_directory)
-var6_button.grid(row=7, column=2)
-
-
-submit_button = tk.Button(root, text="Run", command=submit_values)
-submit_button.grid(row=8, columnspan=4)
-
-root.mainloop()  
+#the window is only built when the GUI is run, so the functions above can be imported without a display
+if __name__ == '__main__':
+    root = tk.Tk()
+    root.title("Cell Profiler Analysis Variable Input")
+
+    #tk variables need a root window, so they are made together with it
+    timelapse = tk.BooleanVar()
+    foci = tk.BooleanVar()
+    outputFormat = tk.StringVar(value='csv')
+
+    var1_label = tk.Label(root, text="Input Cellular Data File:")
+    var1_label.grid(row=0, column=0)
+    var1_entry = tk.Entry(root)
+    var1_entry.grid(row=0, column=1)
+    var1_button = tk.Button(root, text="Select File", command=lambda: open_file(var1_entry))
+    var1_button.grid(row=0, column=2)
+
+    var2_label = tk.Label(root, text="Pixel Conversion Factor:")
+    var2_label.grid(row=1, column=0)
+    var2_entry = tk.Entry(root)
+    var2_entry.grid(row=1, column=1)
+
+    checkbox_label_1 = tk.Label(root, text="Timelapse?")
+    checkbox_label_1.grid(row=2, column=0)
+    checkbox_1 = tk.Checkbutton(root, text="Yes", variable=timelapse, onvalue=True, offvalue=False,command=lambda: toggle_additional_entries(timelapse, var3_entry,var4_entry))
+    checkbox_1.grid(row=2, column=1)
+
+    var3_label = tk.Label(root, text="Time Interval:")
+    var3_label.grid(row=3, column=0)
+    var3_entry = tk.Entry(root, state=tk.DISABLED)
+    var3_entry.grid(row=3, column=1)
+
+    var4_label = tk.Label(root, text="Track file:")
+    var4_label.grid(row=4, column=0)
+    var4_entry = tk.Entry(root,state=tk.DISABLED)
+    var4_entry.grid(row=4, column=1)
+    var4_button = tk.Button(root, text="Select File", command=lambda: open_file(var4_entry))
+    var4_button.grid(row=4, column=2)
+
+    checkbox_label_2 = tk.Label(root, text="Foci?")
+    checkbox_label_2.grid(row=5, column=0)
+    checkbox_2 = tk.Checkbutton(root, text="Yes", variable=foci, onvalue=True, offvalue=False,command=lambda: toggle_additional_entries(foci, var5_entry))
+    checkbox_2.grid(row=5, column=1)
+
+    var5_label = tk.Label(root, text="Input Foci Data File:")
+    var5_label.grid(row=6, column=0)
+    var5_entry = tk.Entry(root,state=tk.DISABLED)
+    var5_entry.grid(row=6, column=1)
+    var5_button = tk.Button(root, text="Select File", command=lambda: open_file(var5_entry))
+    var5_button.grid(row=6, column=2)
+
+    var6_label = tk.Label(root, text="Output Directory:")
+    var6_label.grid(row=7, column=0)
+    var6_entry = tk.Entry(root)
+    var6_entry.grid(row=7, column=1)
+    var6_button = tk.Button(root, text="Select Output Directory", command=select_directory)
+    var6_button.grid(row=7, column=2)
+
+
+    var7_label = tk.Label(root, text="Output Format:")
+    var7_label.grid(row=8, column=0)
+    var7_entry = ttk.Combobox(root, textvariable=outputFormat, values=['csv','parquet','feather'], state='readonly')
+    var7_entry.grid(row=8, column=1)
+
+    submit_button = tk.Button(root, text="Run", command=submit_values)
+    submit_button.grid(row=9, columnspan=4)
+
+    root.mainloop()  
 
  
\ No newline at end of file
@@ -16,25 +16,37 @@ Input:
 Output: 
 1. A new '.csv' file containing single cell data along with the unique 'Cell IDs'
 2. A new '.tif' stack that maps the LAP tracking done by CellProfiler onto of the segmentation done by Omnipose.
-3. A graph of Area vs. Time is output for all single cells tracked for you to generally asses if things are working.
+3. A graph of Area vs. Time is saved as 'areaVsTime.png' for all single cells tracked for you to generally asses if things are working.
+4. For a timelapse, a '.csv' file with one row per cell-through-time: its mother, birth and division area, growth rate and generation time.
 
 Caveats:
 1. This program does not deal with a value of 3 (mitosis) or 4 (gap in track) from CellProfiler's 'TrackObjects_LinkType'
 
-To correctly run this program, scroll down to where the main function starts (LINE 227) and change the relevant information in the designated
+To correctly run this program, scroll down to where the main function starts and change the relevant information in the designated
 'USER INPUT INFORMATION' area. This includes the input and output directories, the name of your input and output files, the colors to use for the
 graph, the pixel-to-micron conversion information, the frame-to-frame time interval of your timelapses, and the type and ordering of the 
 information you want saved in the output file.
+
+This program can also be run from the command line (for example on a cluster node without a display). Every setting of the 'USER INPUT INFORMATION'
+area can be given as an argument or in a '.json' config file, e.g.:
+    python CP_analysis_Version_006.py --config settings.json --timelapse --no-qcPlot
+Run it with --help to see every setting. The plotting and image libraries are only loaded when the tracking overlay or the graph is asked for.
 """
 
 
+import os
+from contextlib import nullcontext
+
 import pandas as pd
-import seaborn
-import matplotlib.pyplot as plt
 import numpy as np
-from skimage import io
-from tqdm import tqdm
-from matplotlib.colors import to_hex
+from cellStitching import stitchCells, formatData, StitcherState
+from cellRelations import findParents, relateFociToCells
+from cellProfilerIO import (readCellProfilerTable, fociTableColumns, renamedColumns, writeTable, appendTable, writeFeather, readTable,
+                            readCellProfilerChunks, FrameReader, TableWriter)
+from cellMetrics import relativeTime, summarizeCells
+from stageCache import StageCache
+from runReport import RunReport
+from areaPlot import plotAreaVsTime
 
 def calculateShape(df,pixelConversion):
     """
@@ -45,217 +57,318 @@ def calculateShape(df,pixelConversion):
     """
     df['AreaShape_Area_um']= df['AreaShape_Area']*(pixelConversion**2)
     df['Aspect Ratio']= df['AreaShape_MajorAxisLength']/df['AreaShape_MinorAxisLength']
-    df['Shape'] = np.where(df['Aspect Ratio'] >= 2, 'rod', 'disk')
+    df['Shape'] = pd.Categorical.from_codes((df['Aspect Ratio'] >= 2).astype(np.int8), categories=['disk','rod'])
     
     return df
 
 
-def findStartingCells(df):
+def visualizeTracking(data,outputDirectory,trackImageDirectory,trackImageFileName,workers=1,seed=None,lineWidth=1,alpha=0.8):
     """
-    Get the cells that start lineages and splits, and start separating the cells. These are cells with a 'TrackObjects_LinkType' of 0 and 2,
-    respectively. Only one daughter in a division even gets the 'TrackObjects_LinkType' of 2 so to get the other daughter cell we look for the
-    cell that that has a 'TrackObjects_LinkType' of 1 that shares the same parent cell. This function gives of the first frame of all cells-through-time
-    and thus we can give them all a unique 'Cell ID' value.
+    This function takes the X,Y center points of instances of cells-through-time and draws lines between them and displays it on top of the
+    original segmentation '.tif' generated from Omnipose. This allows us to visually assess the quality of the tracking done by CellProfiler
+    since the second LAP tracking phase is never shown to you while CellProfiler runs. The lines are drawn straight into the pixels of the
+    input stack (see trackOverlay.py) so the output lines up with it exactly. With more than one worker the frames are drawn in parallel. Every
+    cell-through-time gets a random color, the same 'seed' always gives the same colors.
 
-    This function returns a list of the starting cells found and a modified version of the input dataframe where the starting cells have been removed.
+    This function saves a new '.tif' stack with the tracks visuallized and returns nothing.
     """
-    cellID = 1
-    cellList = []
-    
-    lineageStarts = df.loc[(df['TrackObjects_LinkType'] == 0) | (df['TrackObjects_LinkType'] == 2)]
-    
-    for index,row in lineageStarts.iterrows():
-        cell = []
-        cell.append([cellID,row])
-        cellList.append(cell)
-        df = df.drop(index)
-        cellID += 1
-    for i in tqdm(range(len(cellList))):
-        if cellList[i][-1][1]['TrackObjects_LinkType'] == 2:
-            splitFrame = cellList[i][-1][1]['ImageNumber']
-            splitParent = cellList[i][-1][1]['TrackObjects_ParentObjectNumber']
-            otherDaughter = df.loc[(df['ImageNumber']==splitFrame) &
-                                       (df['TrackObjects_ParentObjectNumber']==splitParent) & 
-                                       (df['TrackObjects_LinkType'] == 1)]
-            #for some reason the length of this .loc is sometimes 0, i think its because cells are moving
-            for index,row in otherDaughter.iterrows():
-                newCell = []
-                newCell.append([cellID,row])
-                cellList.append(newCell)
-                df = df.drop(index)
-                cellID += 1
-    
- 
-    return cellList, df
+    from trackOverlay import drawTracks
 
+    drawTracks(data,os.path.join(trackImageDirectory,trackImageFileName),os.path.join(outputDirectory,'tracks.tif'),lineWidth,alpha=alpha,
+               seed=seed,workers=workers)
 
-def findNextCell(df,currentCell):
-    """
-    Now that we have the starting frame for each cell-through-time we can follow that cell frame by frame and connect them by giving all instances
-    of that cell-through-time the same Cell ID number. This is done by recursively calling this function until the end of a track is reached.
 
-    This functions returns a a list of lists containing all instances of a single, cell-through-time.
+def streamCPData(cellFileName,fociFileName,pixelConversion,timeInterval,outputDirectory,outputCellFileName,outputCellColumnOrder,
+                 outputFociFileName,outputFociColumnOrder,outputFormat,chunkRows,report):
     """
-    cellID = currentCell[-1][0]
-    currentFrame = currentCell[-1][1]['ImageNumber']
-    currentObjectNumber = currentCell[-1][1]['ObjectNumber']
-    currentLineage = currentCell[-1][1]['TrackObjects_Label']
-    nextCell = df.loc[(df['TrackObjects_ParentImageNumber']==currentFrame) 
-                      & (df['TrackObjects_ParentObjectNumber']==currentObjectNumber)
-                      & (df['TrackObjects_Label']==currentLineage)]
-    if not nextCell.empty:
-        for index, row in nextCell.iterrows():
-            currentCell.append([cellID,row])
-            df = df.drop(index)
-        findNextCell(df,currentCell)
-        
-    return currentCell
-
-
-def formatData(cellList):
+    This function stitches a timelapse without ever loading the whole table. 'FilterCells.csv' (and 'foci.csv' if 'fociFileName' is given) is
+    read 'chunkRows' rows at a time and stitched a whole number of frames at a time with a StitcherState, which only keeps the last instance of
+    every cell-through-time still open. The rows of every batch of frames are written to the output files as soon as they are stitched, so the
+    output holds the same rows as analyzeCPData but in the order of the frames: the instances of a cell-through-time are not next to each other
+    as in the output of analyzeCPData, and the foci are only sorted by 'cell ID' within every batch. Sort the tables by 'cell ID' and
+    'ImageNumber' before using them with code that expects every cell in one block. Both tables must be sorted by 'ImageNumber', as
+    CellProfiler exports them.
+
+    This function returns a summary of the run: the number of cells, divisions and foci found and the names of the files saved.
     """
-    This function takes the list of lists of lists of all the cells-through-time and converts it into a dataframe.
-
-    This function returns the new dataframe containing all the cells-through-time with their unique 'Cell ID' as a new column
+    state = StitcherState()
+    summary = {'Cells': 0, 'Divisions': 0, 'Foci': 0}
+    cells = FrameReader(readCellProfilerChunks(cellFileName,outputCellColumnOrder,chunkRows=chunkRows))
+    cellWriter = TableWriter(os.path.join(outputDirectory,outputCellFileName),outputFormat)
+    fociFrames = fociWriter = None
+    if fociFileName:
+        fociFrames = FrameReader(readCellProfilerChunks(fociFileName,outputFociColumnOrder,fociTableColumns,chunkRows))
+        fociWriter = TableWriter(os.path.join(outputDirectory,outputFociFileName),outputFormat)
+    with report.stage('stream') as stage, cellWriter, fociWriter or nullcontext():
+        stage['rowsIn'] = 0
+        while (df := cells.next()) is not None:
+            stage['rowsIn'] += df.shape[0]
+            df = calculateShape(df,pixelConversion)
+            df['Time (hr)'] = (df['ImageNumber']-1)*timeInterval
+            previousRows = state.frontier
+            birthTimes = (state.birthFrames()-1)*timeInterval
+            cellIDs = stitchCells(df,state)
+            #only the cells in the last frame can go on in the next batch
+            state.dropLostCells(state.lastImageNumber)
+            data = formatData(df,cellIDs)
+            del df, cellIDs
+            data['Relative Time'] = relativeTime(data,birthTimes)
+            data = findParents(data,previousRows=previousRows)
+            summary['Divisions'] += int((data['TrackObjects_LinkType'] == 2).sum())
+            if fociFrames is not None:
+                dfFoci = fociFrames.until(state.lastImageNumber)
+                if dfFoci is not None and dfFoci.shape[0]:
+                    dfFoci = calculateShape(dfFoci,pixelConversion)
+                    dfFoci['cell ID'] = relateFociToCells(data,dfFoci)
+                    dfFoci = dfFoci.rename(columns={'AreaShape_Area_um': 'Area'})
+                    fociWriter.write(dfFoci[outputFociColumnOrder].sort_values(by=['cell ID']))
+                    summary['Foci'] += dfFoci.shape[0]
+            cellWriter.write(data.rename(columns=renamedColumns)[outputCellColumnOrder])
+            print(f'Stitched up to ImageNumber {state.lastImageNumber}, {state.frontier.shape[0]} cells open')
+        stage['rowsOut'] = cellWriter.rowsWritten
+    print("The streamed rows are in the order of the frames, sort them by 'cell ID' and 'ImageNumber' to get every cell in one block")
+    summary['Cells'] = state.nextCellID-1
+    summary['Cell File'] = cellWriter.fileName
+    if fociWriter is not None:
+        summary['Foci File'] = fociWriter.fileName
+
+    return summary
+
+
+def analyzeCPData(inputDirectory,inputCellFileName,qualitative_colors,pixelConversion,timeInterval,timelapse,foci,inputFociFileName,
+                  trackImageDirectory,trackImageFileName,drawOverlay,overlayWorkers,overlaySeed,overlayLineWidth,overlayAlpha,qcPlot,
+                  qcPlotMode,outputDirectory,outputCellFileName,outputCellColumnOrder,outputFociFileName,outputFociColumnOrder,
+                  outputSummaryFileName,outputFormat,saveStitchedTable,cacheDirectory,cacheSizeMB,incremental,streamChunkRows,saveRunReport,
+                  profileStages):
     """
-    data = []
-    for cell in cellList:
-        spots = []
-        for spot in cell:
-            spot[1]['cell ID'] = spot[0]
-            spots.append(spot[1])
-        spots = pd.DataFrame(spots)
-        data.append(spots)
-    data = pd.concat(data)
-    
-    return data
+    This function runs the whole analysis with the settings of the 'USER INPUT INFORMATION' block in userSettings() and saves the output files.
+    If 'cacheDirectory' is given, the result of every step is saved there and loaded again on later runs with the same input files and settings
+    (see stageCache.py).
 
+    If 'incremental' is True for a timelapse, the state of the stitching is saved as 'stitcherState.json' in the output directory. The next run
+    then only processes the frames after the last one processed, continues the cells-through-time that were still open with the same
+    'Cell IDs' and adds the new rows to the end of the output files. The tracking '.tif' and the graph are only made on the first run.
 
-def findParents(data):
-    """
-    This function for any given instance of a cell-through-time, finds the parent, or mother, of that instance and records this as a new
-    column in the dataframe. It also records the area of the the parent.
+    The time, CPU time, peak memory and rows in and out of every step are recorded and, if 'saveRunReport' is True, saved as 'runReport.json'
+    and 'runReport.csv' in the output directory (see runReport.py). 'profileStages' also saves a cProfile of every step.
+
+    For a timelapse with an 'outputSummaryFileName', one row per cell-through-time with its birth and division area, growth and elongation rate
+    and generation time (see cellMetrics.py) is also saved. Incremental runs make it again from 'stitchedCells.feather' if 'saveStitchedTable'
+    is True.
 
-    This function returns this updated version of the dataframe.
+    If 'streamChunkRows' is above 0, a timelapse is stitched that many rows at a time by streamCPData instead, which keeps memory use flat for
+    tables bigger than memory but only saves the cell and foci tables, in the order of the frames instead of grouped by 'cell ID'.
+
+    This function returns a summary of the run: the number of cells, divisions and foci found and the names of the files saved.
     """
-    parents = []
-    parentsArea = []
-    for index, row in data.iterrows():
-        parentFrame = row['TrackObjects_ParentImageNumber']
-        parentObjectNumber = row['TrackObjects_ParentObjectNumber']
-        parent = data['cell ID'].loc[(data['ImageNumber']==parentFrame) & (data['ObjectNumber']==parentObjectNumber)]
-        parentArea = data['AreaShape_Area_um'].loc[(data['ImageNumber']==parentFrame) & (data['ObjectNumber']==parentObjectNumber)]
-        if parent.empty:
-            parents.append('NaN')
-        else:
-            for index, value in parent.items():
-                parents.append(value)
-        if parentArea.empty:
-            parentsArea.append('NaN')
-        else:
-            for index, value in parentArea.items():
-                parentsArea.append(value)
-    data['Parent'] = parents
-    data['Parent Area'] = parentsArea
+    report = RunReport(outputDirectory,profileStages,dict(locals()))
+    if timelapse and streamChunkRows:
+        if drawOverlay or qcPlot or outputSummaryFileName or saveStitchedTable or incremental:
+            print('Streaming only saves the cell and foci tables, the other outputs and incremental runs need the whole table')
+        summary = streamCPData(os.path.join(inputDirectory,inputCellFileName),os.path.join(inputDirectory,inputFociFileName) if foci else None,
+                               pixelConversion,timeInterval,outputDirectory,outputCellFileName,outputCellColumnOrder,outputFociFileName,
+                               outputFociColumnOrder,outputFormat,streamChunkRows,report)
+        if saveRunReport:
+            summary['Report File'] = report.save()[0]
+        print('Finished!!!')
+        return summary
+    cache = StageCache(cacheDirectory or None,cacheSizeMB)
+    cellFileName = os.path.join(inputDirectory,inputCellFileName)
+    cellFileHash = cache.fileHash(cellFileName)
+    #sort all data by 'time'
+    readCells = lambda: report.run('ingest',readCellProfilerTable,cellFileName,outputCellColumnOrder).sort_values(by=['ImageNumber'])
+    with report.stage('calculateShape') as stage:
+        df = cache.run('calculateShape',(cellFileHash,outputCellColumnOrder,pixelConversion),
+                       lambda: calculateShape(cache.run('ingest',(cellFileHash,outputCellColumnOrder),readCells),pixelConversion))
+        stage['rowsOut'] = df.shape[0]
+    df['Time (hr)'] = (df['ImageNumber']-1)*timeInterval
+    state = None
+    appending = False
+    cellSummary = None
+    if incremental and timelapse:
+        stateFileName = os.path.join(outputDirectory,'stitcherState.json')
+        state = StitcherState.load(stateFileName) if os.path.exists(stateFileName) else StitcherState()
+        lastImageNumber = state.lastImageNumber
+        appending = lastImageNumber > 0
+        df = df[df['ImageNumber'] > lastImageNumber]
+        print(f'Adding {df.shape[0]} rows after ImageNumber {lastImageNumber}')
+        if appending and df.shape[0] == 0:
+            print('No new frames, Finished!!!')
+            return {'Cells': 0, 'Divisions': 0, 'Foci': 0}
+        previousRows = state.frontier
+        birthFrames = state.birthFrames()
+    initialDataSize = df.shape[0]
+    #print(initialDataSize)
+    
+    print('Finding Cells...')
+    if timelapse:
+        print('Stiching Mothers and Daughters Through Time...')
+        with report.stage('stitching',df.shape[0]) as stage:
+            if state is not None:
+                cellIDs = stitchCells(df,state)
+            else:
+                cellIDs = cache.run('stitching',(cellFileHash,),stitchCells,df)
+            stage['rowsOut'] = int(np.count_nonzero(cellIDs))
+        print('Found!!!')
+        print('Formating...')
+        data = report.run('formatData',formatData,df,cellIDs,rowsIn=df.shape[0])
+        del df, cellIDs #free the input table, 'data' now holds every connected row
+        finalDataDize = data.shape[0]
+        #print(finalDataDize)
+        try:
+            if initialDataSize != finalDataDize:
+                raise ValueError("Something went wrong with the concatenation of cells!")
+            else:
+                print('Cells successfully connected through time!!!')
+        except ValueError as e:
+            print(f"Error: {e}")
+   
     
-    return data
+        with report.stage('relativeTiming',data.shape[0]):
+            #cells that were already open are timed from the frame they were first seen in
+            data['Relative Time'] = relativeTime(data,(birthFrames-1)*timeInterval if state is not None else None)
+        with report.stage('parents',data.shape[0]):
+            if state is not None:
+                data = findParents(data,previousRows=previousRows)
+            else:
+                parents = cache.run('parents',(cellFileHash,pixelConversion),lambda: findParents(data)[['Parent','Parent Area']])
+                for column in parents:
+                    data[column] = parents[column]
+        if saveStitchedTable:
+            with report.stage('saveStitchedTable',data.shape[0]):
+                if appending:
+                    appendTable(data,os.path.join(outputDirectory,'stitchedCells.feather'),'feather')
+                else:
+                    writeFeather(data,os.path.join(outputDirectory,'stitchedCells.feather'))
+        if outputSummaryFileName:
+            with report.stage('cellMetrics',data.shape[0]) as stage:
+                if not appending:
+                    cellSummary = summarizeCells(data,pixelConversion)
+                elif saveStitchedTable:
+                    #cells that were still open have grown, so the summary is made again from all stitched rows
+                    stitched = readTable(os.path.join(outputDirectory,'stitchedCells.feather'),
+                                         ['cell ID','ImageNumber','ObjectNumber','TrackObjects_Label','TrackObjects_LinkType',
+                                          'TrackObjects_ParentImageNumber','TrackObjects_ParentObjectNumber','Time (hr)',
+                                          'AreaShape_Area_um','AreaShape_MajorAxisLength'])
+                    cellSummary = summarizeCells(stitched,pixelConversion)
+                    del stitched
+                else:
+                    print('The cell summary is only made on the first incremental run unless saveStitchedTable is True')
+                stage['rowsOut'] = cellSummary.shape[0] if cellSummary is not None else None
+        if appending and (drawOverlay or qcPlot):
+            print('The tracking .tif and the graph are only made on the first incremental run')
+        elif drawOverlay:
+            print('Tracking Cells...')
+            with report.stage('overlay',data.shape[0]):
+                trackImageHash = cache.fileHash(os.path.join(trackImageDirectory,trackImageFileName))
+                cache.runFile('overlay',(cellFileHash,trackImageHash,overlaySeed,overlayLineWidth,overlayAlpha),
+                              os.path.join(outputDirectory,'tracks.tif'),visualizeTracking,data,outputDirectory,trackImageDirectory,
+                              trackImageFileName,overlayWorkers,overlaySeed,overlayLineWidth,overlayAlpha)
+            print('Tracked!!!')
+        if qcPlot and not appending:
+            print('Plotting...')
+            report.run('qcPlot',plotAreaVsTime,data,os.path.join(outputDirectory,'areaVsTime.png'),qualitative_colors,qcPlotMode,
+                       rowsIn=data.shape[0])
+    else:
+        data = df
+        ids = list(range(data.shape[0]))
+        data['cell ID'] = ids
+        print('Found!!!')
+        
+    if foci:
+        fociFileName = os.path.join(inputDirectory,inputFociFileName)
+        fociFileHash = cache.fileHash(fociFileName)
+        readFoci = lambda: report.run('fociIngest',readCellProfilerTable,fociFileName,outputFociColumnOrder,fociTableColumns)
+        with report.stage('fociShape') as stage:
+            dfFoci = cache.run('calculateShape',(fociFileHash,outputFociColumnOrder,pixelConversion),
+                               lambda: calculateShape(cache.run('ingest',(fociFileHash,outputFociColumnOrder),readFoci),pixelConversion))
+            stage['rowsOut'] = dfFoci.shape[0]
+        print('Assigning Foci to Cells...')
+        with report.stage('foci',dfFoci.shape[0]) as stage:
+            if state is not None:
+                dfFoci = dfFoci[dfFoci['ImageNumber'] > lastImageNumber].copy()
+                dfFoci['cell ID'] = relateFociToCells(data,dfFoci)
+            else:
+                dfFoci['cell ID'] = cache.run('foci',(cellFileHash,fociFileHash,timelapse),relateFociToCells,data,dfFoci)
+            stage['rowsOut'] = int(dfFoci['cell ID'].notna().sum())
+        print('Assigned!!!')
+        
+        
+        
+    summary = {'Cells': data['cell ID'].nunique(),
+               'Divisions': int((data['TrackObjects_LinkType'] == 2).sum()) if timelapse else 0,
+               'Foci': len(dfFoci) if foci else 0}
+    saveTable = appendTable if appending else writeTable
+    with report.stage('output',data.shape[0]+(dfFoci.shape[0] if foci else 0)):
+        data = data.rename(columns=renamedColumns)
+        outputDF = data[outputCellColumnOrder] 
+        summary['Cell File'] = saveTable(outputDF,os.path.join(outputDirectory,outputCellFileName),outputFormat)
+        if foci:
+            dfFoci = dfFoci.rename(columns={'AreaShape_Area_um': 'Area'})
+            outputDF = dfFoci[outputFociColumnOrder]
+            outputDF = outputDF.sort_values(by=['cell ID'])
+            summary['Foci File'] = saveTable(outputDF,os.path.join(outputDirectory,outputFociFileName),outputFormat)
+        if cellSummary is not None:
+            summary['Summary File'] = writeTable(cellSummary,os.path.join(outputDirectory,outputSummaryFileName),outputFormat)
+    if state is not None:
+        #only the cells in the last frame can go on in the next run, the others were lost and would stay in the state forever
+        state.dropLostCells(state.lastImageNumber)
+        #the state is only saved once the output files are, so a failed run can simply be run again
+        state.save(stateFileName)
+    if saveRunReport:
+        summary['Report File'] = report.save()[0]
+    print('Finished!!!')
+
+    return summary
 
 
-def relativeTiming(group):
+def parseArguments(settings,arguments=None):
     """
-    This function creates a new column in the dataframe that normalizes the time so that the first instance of all cells-through-time starts
-    at zero.
+    Every setting of the 'USER INPUT INFORMATION' block can also be given on the command line (e.g. --timelapse --pixelConversion 0.065) or in a
+    '.json' config file given with --config that holds {setting name: value}. Command line arguments win over the config file, which wins over
+    the 'USER INPUT INFORMATION' block.
 
-    This function returns this modified version of the dataframe.
+    This function returns the updated settings.
     """
-    birthTime = group['Time (hr)'].iloc[0]
-    group['Relative Time'] = group['Time (hr)'] - birthTime
-    
-    return group
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Give every cell-through-time in a CellProfiler table a unique Cell ID.')
+    parser.add_argument('--config', help="'.json' file of {setting name: value} pairs")
+    for name, value in settings.items():
+        if isinstance(value, bool):
+            parser.add_argument('--'+name, action=argparse.BooleanOptionalAction, default=None)
+        elif isinstance(value, list):
+            parser.add_argument('--'+name, nargs='+', default=None, metavar='COLUMN')
+        elif isinstance(value, (int, float)):
+            parser.add_argument('--'+name, type=type(value), default=None, metavar=type(value).__name__.upper())
+        else:
+            parser.add_argument('--'+name, default=None, metavar='TEXT')
+    parsed = vars(parser.parse_args(arguments))
 
-                 
-def randomColoring(group):
-    color =  to_hex(tuple(np.random.rand(3)))
-    group['randomColor'] = color
-    
-    return group
+    settings = dict(settings)
+    configFileName = parsed.pop('config')
+    if configFileName is not None:
+        with open(configFileName, 'r') as configFile:
+            config = json.load(configFile)
+        unknown = sorted(set(config) - set(settings))
+        if unknown:
+            parser.error(f"unknown settings in {configFileName}: {', '.join(unknown)}")
+        settings.update(config)
+    settings.update({name: value for name, value in parsed.items() if value is not None})
 
+    return settings
 
-def visualizeTracking(data,outputDirectory,trackImageDirectory,trackImageFileName):
-    """
-    This function takes the X,Y center points of instances of cells-through-time and draws lines between them and displays it on top of the
-    original segmentation '.tif' generated from Omnipose. This allows us to visually assess the quality of the tracking done by CellProfiler
-    since the second LAP tracking phase is never shown to you while CellProfiler runs.
 
-    This function saves a new '.tif' stack with the tracks visuallized and returns nothing.
+def userSettings():
+    """
+    This function returns the settings of the 'USER INPUT INFORMATION' block as a dictionary of {setting name: value}.
     """
-    cells = data.groupby('cell ID',group_keys=False)
-    data = cells.apply(randomColoring)
-    cells = data.groupby('cell ID')
-    
-    
-    im = io.imread(trackImageDirectory+trackImageFileName)
-    print(im.shape)
-    #frames, heightPixels, widthPixels = im.shape
-    frames, heightPixels, widthPixels, channels = im.shape
-    dpi = 300
-    figSizeInches = (widthPixels / dpi, heightPixels / dpi)
-    stackedFrames = []
-    plt.show()
-    plt.ioff()
-    fig, tx = plt.subplots(dpi=dpi,figsize=figSizeInches)
-    img = tx.imshow(im[0, :, :], cmap='gray')
-    removeLine = False
-    line0 = []
-    for frame in tqdm(range(im.shape[0])):
-        currentFrame = im[frame][:][:]
-        img.set_data(currentFrame)
-        if removeLine:
-            for line in tx.lines:
-                line.remove()
-            fig.canvas.draw()
-        for group, values in cells:
-            if frame > 10:
-                subDF = values.loc[(values['ImageNumber'] >= frame-3)&
-                                   (values['ImageNumber'] <= frame+3)]
-            else:
-                subDF = values.loc[values['ImageNumber'] <= frame] #get 5 frames of information ahead of current frame
-            x = list(subDF['Location_Center_X'])
-            y = list(subDF['Location_Center_Y'])
-            c = values['randomColor'].iloc[0]
-            for i in range(len(x)):
-                if i > 0:
-                    line0, = tx.plot([x[i-1], x[i]], 
-                            [y[i-1], y[i]],
-                            color=c,alpha=0.8)
-                    removeLine = True
-
-        fig.canvas.draw()  # Draw the figure to update the canvas
-        frame = np.array(fig.canvas.renderer.buffer_rgba())[:, :, :3]  # Extract RGB values
-        stackedFrames.append(frame)
-        plt.close()
-    trackingImage = np.stack(stackedFrames)
-    io.imsave(outputDirectory+'tracks.tif', trackingImage)
-    
-   
-def relateFociToCells(data,dfFoci):
-    cellIDs = []
-    for i in tqdm(range(dfFoci.shape[0])):
-        frame = dfFoci.iloc[i]['ImageNumber']
-        fociParent = dfFoci.iloc[i]['Parent_FilterCells']
-        cellID = int(data['cell ID'].loc[(data['ImageNumber']==frame) &
-                                       (data['ObjectNumber']==fociParent)])
-        cellIDs.append(cellID)
-    
-    return cellIDs
-                
-    
-def main():
     #####################################################
     ####### USER INPUT INFORMATION START HERE ###########
     inputDirectory = '/Users/johnmallon/Downloads/Omnipose csvs test case/'
     inputCellFileName = "FilterCells.csv"
-    qualitative_colors = seaborn.color_palette("Set3")
+    qualitative_colors = "Set3"  #name of the matplotlib or seaborn color palette used for the graph
     pixelConversion = 0.065  # Pixel conversion to um for a 100X objective using Bisson Lab Microscope (Tupan)
     timeInterval = 10/60  #in hours
     timelapse = False
@@ -263,6 +376,13 @@ def main():
     inputFociFileName = "foci.csv"
     trackImageDirectory = "C:\\Users\\bisso\\Desktop\\workshop\\phase\\"
     trackImageFileName = "phase_segmentation_omnipose.tif"
+    drawOverlay = True  #draw the tracks on the track image and save them as 'tracks.tif'
+    overlayWorkers = 1  #number of processes drawing 'tracks.tif', set to 0 to use every CPU
+    overlaySeed = 0  #seed of the random color of every track, the same seed always gives the same colors
+    overlayLineWidth = 1  #width of the track lines in pixels
+    overlayAlpha = 0.8  #opacity of the track lines
+    qcPlot = True  #save a graph of Area vs. Time for all cells as 'areaVsTime.png'
+    qcPlotMode = 'auto'  #'points', 'lines' (one line per cell), 'density' (for very big runs) or 'auto' to pick points or density by size
     outputDirectory = '/Users/johnmallon/Downloads/Omnipose csvs test case/'
     outputCellFileName = 'cellsThroughTime.csv'
     #this list determines which information and the ordering of it in the saved output '.csv' file
@@ -274,81 +394,38 @@ def main():
                          'Children_foci_Count']
     outputFociFileName = 'fociThroughTime.csv'
     outputFociColumnOrder = ['cell ID','Location_Center_X','Location_Center_Y','Area']
+    #one row per cell-through-time of a timelapse: birth and division area, growth and elongation rate and generation time, '' to skip it
+    outputSummaryFileName = 'cellSummary.csv'
+    outputFormat = 'csv'  #'csv', 'parquet' or 'feather'. Parquet and feather files load much faster but need the 'pyarrow' package
+    saveStitchedTable = False  #also save every column of the stitched cells as 'stitchedCells.feather' so later analysis can load any of them
+    cacheDirectory = ''  #folder for saving the result of every step so re-runs skip the steps whose inputs did not change, '' to turn it off
+    cacheSizeMB = 2000  #the results used the longest time ago are deleted when the cache gets bigger than this
+    incremental = False  #only add the frames after the last processed one to the output files, keeping the 'Cell IDs' of the earlier runs
+    #stitch a timelapse this many rows at a time for tables bigger than memory, 0 to read it whole. Only the cell and foci tables are saved, and
+    #their rows are in the order of the frames instead of grouped by 'cell ID'
+    streamChunkRows = 0
+    saveRunReport = True  #save the time, memory and rows of every step as 'runReport.json' and 'runReport.csv'
+    profileStages = False  #also save a cProfile of every step in the 'profiles' folder
     ####### USER INPUT INFORMATION END HERE #############
     #####################################################
-    
-    df = pd.read_csv(inputDirectory+inputCellFileName)
-    df = df.sort_values(by=['ImageNumber']) #sort all data by 'time'
-    df = calculateShape(df,pixelConversion)
-    df['Time (hr)'] = (df['ImageNumber']-1)*timeInterval
-    initialDataSize = df.shape[0]
-    #print(initialDataSize)
-    
-    print('Finding Cells...')
-    if timelapse:
-        cellList,df = findStartingCells(df)
-        print('Found!!!')
-    
-    if timelapse:
-        data = []
-        print('Stiching Mothers and Daughters Through Time...')
-        for i in tqdm(range(len(cellList))):
-            stitchedCell = findNextCell(df,cellList[i])
-            data.append(stitchedCell)
-        print('Formating...')
-        data = formatData(data)
-        finalDataDize = data.shape[0]
-        #print(finalDataDize)
-        try:
-            if initialDataSize != finalDataDize:
-                raise ValueError("Something went wrong with the concatenation of cells!")
-            else:
-                print('Cells successfully connected through time!!!')
-        except ValueError as e:
-            print(f"Error: {e}")
-   
-    
-        cells = data.groupby('cell ID',group_keys=False)
-        data = cells.apply(relativeTiming)
-        data = findParents(data)
-        print('Tracking Cells...')
-        visualizeTracking(data,outputDirectory,trackImageDirectory,trackImageFileName)
-        print('Tracked!!!')
-        plt.ion()
-        #plot data with time and relative time
-        figure, ax = plt.subplots(dpi=300) 
-        seaborn.scatterplot(data=data,ax=ax,hue='cell ID',
-                   x='Time (hr)',y='AreaShape_Area_um',
-                   edgecolor="k",linewidth=0.75,palette=qualitative_colors,
-                   zorder=1.0)
-        ax.get_legend().set_visible(False)
-    else:
-        data = df
-        ids = list(range(data.shape[0]))
-        data['cell ID'] = ids
-        print('Found!!!')
-        
-    if foci:
-        dfFoci = pd.read_csv(inputDirectory+inputFociFileName)
-        dfFoci = calculateShape(dfFoci,pixelConversion)
-        print('Assigning Foci to Cells...')
-        cellIDs = relateFociToCells(data,dfFoci)
-        dfFoci['cell ID'] = cellIDs
-        print('Assigned!!!')
-        
-        
-        
-    data = data.rename(columns={'TrackObjects_Label': 'Lineage'})
-    data = data.rename(columns={'AreaShape_Area_um': 'Area'})
-    data = data.rename(columns={'AreaShape_Solidity': 'Solidity'})
-    data = data.rename(columns={'AreaShape_FormFactor': 'Circularity'})
-    outputDF = data[outputCellColumnOrder] 
-    outputDF.to_csv(outputDirectory+outputCellFileName, index=False, header=True)
-    if foci:
-        dfFoci = dfFoci.rename(columns={'AreaShape_Area_um': 'Area'})
-        outputDF = dfFoci[outputFociColumnOrder]
-        outputDF = outputDF.sort_values(by=['cell ID'])
-        outputDF.to_csv(outputDirectory+outputFociFileName, index=False, header=True)                 
-    print('Finished!!!')
 
-main()
+    settings = {'inputDirectory': inputDirectory, 'inputCellFileName': inputCellFileName, 'qualitative_colors': qualitative_colors,
+                'pixelConversion': pixelConversion, 'timeInterval': timeInterval, 'timelapse': timelapse, 'foci': foci,
+                'inputFociFileName': inputFociFileName, 'trackImageDirectory': trackImageDirectory, 'trackImageFileName': trackImageFileName,
+                'drawOverlay': drawOverlay, 'overlayWorkers': overlayWorkers, 'overlaySeed': overlaySeed,
+                'overlayLineWidth': overlayLineWidth, 'overlayAlpha': overlayAlpha, 'qcPlot': qcPlot, 'qcPlotMode': qcPlotMode,
+                'outputDirectory': outputDirectory,
+                'outputCellFileName': outputCellFileName, 'outputCellColumnOrder': outputCellColumnOrder,
+                'outputFociFileName': outputFociFileName, 'outputFociColumnOrder': outputFociColumnOrder,
+                'outputSummaryFileName': outputSummaryFileName, 'outputFormat': outputFormat,
+                'saveStitchedTable': saveStitchedTable, 'cacheDirectory': cacheDirectory, 'cacheSizeMB': cacheSizeMB,
+                'incremental': incremental, 'streamChunkRows': streamChunkRows, 'saveRunReport': saveRunReport, 'profileStages': profileStages}
+
+    return settings
+
+
+def main(arguments=None):
+    analyzeCPData(**parseArguments(userSettings(),arguments))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Quality control graph of the area of every cell-through-time against time, shared by 'CP_analysis_Version_006.py' and
+'CP_analysis_GUI_Version_007.py'.
+
+The graph used to be a seaborn scatterplot with one hue per 'Cell ID', which builds a color mapping and legend entry for every cell and
+takes minutes on big runs. Here all instances are drawn as one collection: either one point per instance ('points', the same look as before),
+one line segment between every pair of consecutive instances of a cell ('lines'), or, for very large runs, a 2D histogram of how many
+instances fall in every bin ('density'). The colors repeat the palette by 'Cell ID'. The figure is drawn without pyplot and saved straight to
+a file, so no window or display is needed.
+"""
+
+import numpy as np
+
+
+def cellColors(cellIDs,palette='Set3'):
+    """
+    This function returns an RGBA color for every value of 'cellIDs', going around the colors of the matplotlib or seaborn 'palette'.
+    """
+    import matplotlib
+
+    try:
+        colors = np.asarray(matplotlib.colormaps[palette].colors)
+    except (KeyError, AttributeError):
+        import seaborn
+        colors = np.asarray(seaborn.color_palette(palette))
+    colors = matplotlib.colors.to_rgba_array(colors)
+
+    return colors[np.asarray(cellIDs, dtype=np.int64) % len(colors)]
+
+
+def plotAreaVsTime(data,outputFileName,palette='Set3',mode='auto',x='Time (hr)',y='AreaShape_Area_um',dpi=300,densityThreshold=200000,
+                   bins=200):
+    """
+    Draw 'y' against 'x' for every instance of a cell-through-time in 'data' and save the figure as 'outputFileName' (the format is taken from
+    its extension). 'mode' is 'points', 'lines', 'density', or 'auto' to draw points up to 'densityThreshold' instances and a density of
+    'bins' x 'bins' bins above that.
+
+    This function returns the name of the file saved.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.collections import LineCollection
+    from matplotlib.colors import LogNorm
+
+    if mode == 'auto':
+        mode = 'density' if len(data) > densityThreshold else 'points'
+    cellIDs = data['cell ID'].to_numpy()
+    xValues = data[x].to_numpy(dtype=np.float64)
+    yValues = data[y].to_numpy(dtype=np.float64)
+
+    figure = Figure(dpi=dpi)
+    ax = figure.subplots()
+    if mode == 'points':
+        ax.scatter(xValues, yValues, c=cellColors(cellIDs, palette), edgecolors='k', linewidths=0.75, zorder=1.0, rasterized=True)
+    elif mode == 'lines':
+        order = np.lexsort((xValues, cellIDs))
+        #one segment from every instance to the next instance of the same cell
+        sameCell = cellIDs[order[1:]] == cellIDs[order[:-1]]
+        starts, ends = order[:-1][sameCell], order[1:][sameCell]
+        segments = np.stack([np.column_stack([xValues[starts], yValues[starts]]), np.column_stack([xValues[ends], yValues[ends]])], axis=1)
+        ax.add_collection(LineCollection(segments, colors=cellColors(cellIDs[starts], palette), linewidths=0.5, rasterized=True))
+        ax.autoscale_view()
+    elif mode == 'density':
+        counts, xEdges, yEdges = np.histogram2d(xValues, yValues, bins=bins)
+        counts = np.ma.masked_equal(counts, 0)
+        mesh = ax.pcolormesh(xEdges, yEdges, counts.T, norm=LogNorm(vmin=1, vmax=max(counts.max(), 1)), cmap='viridis', rasterized=True)
+        figure.colorbar(mesh, ax=ax, label='instances')
+    else:
+        raise ValueError(f"Unknown plot mode '{mode}', use 'points', 'lines', 'density' or 'auto'")
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    figure.savefig(outputFileName)
+
+    return outputFileName
@@ -0,0 +1,208 @@
+"""
+Batch mode for 'CP_analysis_Version_006.py'.
+
+Every field of view of an experiment gives its own 'FilterCells.csv' (and 'foci.csv'), which used to be analyzed one at a time by changing
+'inputDirectory' and running CP_analysis again. Here the datasets are listed once, either in a manifest or with a glob pattern, and analyzed
+in parallel by a pool of worker processes. Each dataset can have its own pixel conversion, time interval or any other setting of the
+'USER INPUT INFORMATION' block; everything that is not given falls back to that block, the '--config' file and the command line.
+
+A manifest is a '.json' list of {setting name: value} dictionaries or a '.csv' table with one column per setting, e.g.:
+    [{"name": "fov1", "inputDirectory": "exp1/fov1", "pixelConversion": 0.065, "timeInterval": 0.1667},
+     {"name": "fov2", "inputDirectory": "exp1/fov2", "pixelConversion": 0.1, "timeInterval": 0.5}]
+Relative paths are taken from the folder of the manifest. 'name' is the dataset key and defaults to the name of the input folder.
+
+Run it with e.g.:
+    python batchAnalysis.py --manifest datasets.json --batchOutputDirectory results --workers 4 --timelapse
+    python batchAnalysis.py --glob "exp1/*/FilterCells.csv" --batchOutputDirectory results --pixelConversion 0.065
+
+Each dataset is saved to its own folder of 'batchOutputDirectory' together with the log of its run. A dataset that fails is reported and
+does not stop the others. When all datasets are done the output tables are joined into one table with a 'Dataset' column and a
+'batchSummary.csv' of the cells, divisions and run time of every dataset is saved.
+"""
+
+import os
+import glob
+import time
+import traceback
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from CP_analysis_Version_006 import analyzeCPData, parseArguments, userSettings
+from cellProfilerIO import readTable, writeTable
+
+
+def readManifest(fileName):
+    """
+    Read the list of datasets from a '.json' or '.csv' manifest. Empty cells of a '.csv' manifest are left out so that those settings fall
+    back to the shared ones, and relative folders are taken from the folder of the manifest.
+
+    This function returns a list of {setting name: value} dictionaries, one per dataset.
+    """
+    import json
+
+    if fileName.endswith('.json'):
+        with open(fileName, 'r') as manifestFile:
+            datasets = json.load(manifestFile)
+    else:
+        manifest = pd.read_csv(fileName)
+        datasets = [{name: value.item() if hasattr(value, 'item') else value for name, value in row.items() if pd.notna(value)}
+                    for row in manifest.to_dict('records')]
+
+    manifestDirectory = os.path.dirname(os.path.abspath(fileName))
+    for dataset in datasets:
+        for setting in ('inputDirectory', 'trackImageDirectory', 'outputDirectory'):
+            if setting in dataset:
+                dataset[setting] = os.path.join(manifestDirectory, dataset[setting])
+
+    return datasets
+
+
+def findDatasets(pattern):
+    """
+    This function returns one dataset for every cell table matching the glob 'pattern', e.g. "exp1/*/FilterCells.csv".
+    """
+    return [{'inputDirectory': os.path.dirname(fileName), 'inputCellFileName': os.path.basename(fileName)}
+            for fileName in sorted(glob.glob(pattern))]
+
+
+def nameDatasets(datasets):
+    """
+    Give every dataset a unique 'name', the name of its input folder unless one is given. Repeated names get a number added.
+
+    This function returns the list of names.
+    """
+    names = []
+    for dataset in datasets:
+        name = str(dataset.get('name') or os.path.basename(os.path.normpath(dataset['inputDirectory'])))
+        uniqueName, copy = name, 1
+        while uniqueName in names:
+            copy += 1
+            uniqueName = f'{name}_{copy}'
+        names.append(uniqueName)
+
+    return names
+
+
+def runDataset(name,settings):
+    """
+    Run the analysis of one dataset, writing everything it prints to 'analysis.log' in its output folder. Errors are caught so that one bad
+    dataset does not stop the batch.
+
+    This function returns the summary of the run with its 'Status', 'Runtime (s)' and 'Error'.
+    """
+    os.makedirs(settings['outputDirectory'], exist_ok=True)
+    summary = {'Dataset': name}
+    start = time.perf_counter()
+    with open(os.path.join(settings['outputDirectory'], 'analysis.log'), 'w') as log, redirect_stdout(log):
+        try:
+            summary.update(analyzeCPData(**settings))
+            summary['Status'] = 'ok'
+        except Exception as e:
+            traceback.print_exc(file=log)
+            summary['Status'] = 'failed'
+            summary['Error'] = f'{type(e).__name__}: {e}'
+    summary['Runtime (s)'] = round(time.perf_counter()-start, 3)
+
+    return summary
+
+
+def combineTables(summary,fileColumn,outputFileName,outputFormat):
+    """
+    Join the tables listed in the 'fileColumn' of the batch summary into one table with the dataset key as its first column, 'Dataset'.
+
+    This function returns the name of the file saved, or None if no dataset saved such a table.
+    """
+    tables = []
+    for name, fileName in zip(summary['Dataset'], summary[fileColumn]):
+        if isinstance(fileName, str):
+            table = readTable(fileName)
+            table.insert(0, 'Dataset', name)
+            tables.append(table)
+    if not tables:
+        return None
+
+    return writeTable(pd.concat(tables, ignore_index=True), outputFileName, outputFormat, ('Dataset','cell ID','ImageNumber'))
+
+
+def runBatch(datasets,settings,batchOutputDirectory,workers=1):
+    """
+    Analyze every dataset with the shared 'settings' updated by the settings of the dataset. Datasets are saved to their own folder of
+    'batchOutputDirectory' unless they give an 'outputDirectory'. With 'workers' above 1 (or 0/None for one per CPU) the datasets are run by a
+    pool of processes.
+
+    This function returns the batch summary as a dataframe after saving it and the joined output tables to 'batchOutputDirectory'.
+    """
+    unknown = sorted({setting for dataset in datasets for setting in dataset} - set(settings) - {'name'})
+    if unknown:
+        raise ValueError(f"Unknown settings in the datasets: {', '.join(unknown)}")
+    os.makedirs(batchOutputDirectory, exist_ok=True)
+
+    jobs = []
+    for name, dataset in zip(nameDatasets(datasets), datasets):
+        jobSettings = dict(settings, trackImageDirectory=dataset['inputDirectory'],
+                           outputDirectory=os.path.join(batchOutputDirectory, name))
+        jobSettings.update({setting: value for setting, value in dataset.items() if setting != 'name'})
+        jobs.append((name, jobSettings))
+
+    workers = min(workers or os.cpu_count(), max(len(jobs), 1))
+    summaries = [None]*len(jobs)
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = {pool.submit(runDataset, name, jobSettings): i for i, (name, jobSettings) in enumerate(jobs)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    summaries[i] = future.result()
+                except Exception as e:
+                    #the worker itself died, e.g. it ran out of memory
+                    summaries[i] = {'Dataset': jobs[i][0], 'Status': 'failed', 'Error': f'{type(e).__name__}: {e}'}
+                print(f"{summaries[i]['Dataset']}: {summaries[i]['Status']}")
+    else:
+        for i, (name, jobSettings) in enumerate(jobs):
+            summaries[i] = runDataset(name, jobSettings)
+            print(f"{name}: {summaries[i]['Status']}")
+
+    summary = pd.DataFrame(summaries, columns=['Dataset','Status','Cells','Divisions','Foci','Runtime (s)','Error',
+                                               'Cell File','Foci File','Summary File'])
+    summary[['Cells','Divisions','Foci']] = summary[['Cells','Divisions','Foci']].astype('Int64')
+    combineTables(summary, 'Cell File', os.path.join(batchOutputDirectory, settings['outputCellFileName']), settings['outputFormat'])
+    combineTables(summary, 'Foci File', os.path.join(batchOutputDirectory, settings['outputFociFileName']), settings['outputFormat'])
+    if settings['outputSummaryFileName']:
+        combineTables(summary, 'Summary File', os.path.join(batchOutputDirectory, settings['outputSummaryFileName']),
+                      settings['outputFormat'])
+    summary.to_csv(os.path.join(batchOutputDirectory, 'batchSummary.csv'), index=False, header=True)
+
+    finished = summary[summary['Status'] == 'ok']
+    print(f"{len(finished)} of {len(summary)} datasets finished: {int(finished['Cells'].sum())} cells, "
+          f"{int(finished['Divisions'].sum())} divisions in {summary['Runtime (s)'].sum():.1f} s of analysis")
+    for name, error in zip(summary['Dataset'], summary['Error']):
+        if isinstance(error, str):
+            print(f'{name} failed: {error}')
+
+    return summary
+
+
+def main(arguments=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run CP_analysis on many datasets at once.',
+                                     epilog='Any setting of CP_analysis_Version_006.py (see its --help) can also be given and is shared by every '
+                                            'dataset that does not set it itself.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--manifest', help="'.json' or '.csv' list of datasets and their settings")
+    source.add_argument('--glob', help='glob pattern of the cell tables to analyze, e.g. "exp1/*/FilterCells.csv"')
+    parser.add_argument('--batchOutputDirectory', required=True, help='folder for the dataset folders and the joined tables')
+    parser.add_argument('--workers', type=int, default=1, help='number of datasets analyzed at once, 0 for one per CPU')
+    parsed, settingArguments = parser.parse_known_args(arguments)
+
+    settings = parseArguments(userSettings(), settingArguments)
+    datasets = readManifest(parsed.manifest) if parsed.manifest else findDatasets(parsed.glob)
+    if not datasets:
+        parser.error('no datasets found')
+    summary = runBatch(datasets, settings, parsed.batchOutputDirectory, parsed.workers)
+
+    return summary
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+Benchmark of every step of CP_analysis on synthetic data of growing size.
+
+For every size asked for, tables of about that many objects are made with syntheticData.generateTables and saved as '.csv' files, then each
+step of the analysis is run on them in order: reading the table (ingest), calculateShape, stitchCells (which replaced findStartingCells and
+findNextCell), formatData, relativeTiming, findParents, cellMetrics, relateFociToCells, output (picking the output columns and saving the
+tables) and visualizeTracking. Each step is timed 'repeat' times (the fastest run is kept) and run once more under tracemalloc to find the peak
+memory it allocates. The results are saved as '.json' so that runs before and after a change can be compared:
+    python benchmarkStages.py --objects 1e3 1e4 1e5 1e6 --output after.json --baseline before.json
+Steps that got slower than 'threshold' times the baseline are listed and the script exits with an error.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import CP_analysis_Version_006 as analysis
+from syntheticData import generateTables, cellsForObjects, writeTrackImage
+from cellStitching import stitchCells, formatData
+from cellRelations import findParents, relateFociToCells
+from cellProfilerIO import readCellProfilerTable, fociTableColumns, renamedColumns, writeTable
+from cellMetrics import relativeTime, summarizeCells
+
+
+def measureStage(function,makeArguments,repeat=3,measureMemory=True):
+    """
+    Run function(*makeArguments()) 'repeat' times, with new arguments every time so that steps that change their input in place always start
+    from the same data. Making the arguments is not timed.
+
+    This function returns the result of the last run, the fastest wall time in seconds and the peak memory allocated in MB (None if not
+    measured).
+    """
+    seconds = []
+    for i in range(repeat):
+        arguments = makeArguments()
+        start = time.perf_counter()
+        result = function(*arguments)
+        seconds.append(time.perf_counter()-start)
+        del arguments
+
+    peakMB = None
+    if measureMemory:
+        arguments = makeArguments()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        function(*arguments)
+        peakMB = (tracemalloc.get_traced_memory()[1]-before)/1e6
+        tracemalloc.stop()
+        del arguments
+
+    return result, min(seconds), peakMB
+
+
+def benchmarkSize(nObjects,nFrames,divisionRate,workDirectory,repeat=3,measureMemory=True,overlay=True,seed=0):
+    """
+    Make synthetic tables of about 'nObjects' objects over 'nFrames' frames and benchmark every step of the analysis on them.
+
+    This function returns a list with one dictionary of results per step.
+    """
+    settings = analysis.userSettings()
+    nCells = cellsForObjects(nObjects, nFrames, divisionRate)
+    cells, foci = generateTables(nCells, nFrames, divisionRate, seed=seed)
+    cellFileName = os.path.join(workDirectory, 'FilterCells.csv')
+    fociFileName = os.path.join(workDirectory, 'foci.csv')
+    cells.to_csv(cellFileName, index=False)
+    foci.to_csv(fociFileName, index=False)
+    del cells, foci
+    dfFoci = analysis.calculateShape(readCellProfilerTable(fociFileName, settings['outputFociColumnOrder'], fociTableColumns),
+                                     settings['pixelConversion'])
+
+    def ingest():
+        return readCellProfilerTable(cellFileName, settings['outputCellColumnOrder']).sort_values(by=['ImageNumber'])
+
+    def shape(df):
+        df = analysis.calculateShape(df, settings['pixelConversion'])
+        df['Time (hr)'] = (df['ImageNumber']-1)*settings['timeInterval']
+        return df
+
+    def relativeTiming(data):
+        data['Relative Time'] = relativeTime(data)
+        return data
+
+    def output(data,dfFoci):
+        #the same columns are picked and saved as in analyzeCPData, so a table missing one of them fails here
+        outputDF = data.rename(columns=renamedColumns)[settings['outputCellColumnOrder']]
+        writeTable(outputDF, os.path.join(workDirectory, settings['outputCellFileName']), settings['outputFormat'])
+        dfFoci = dfFoci.rename(columns={'AreaShape_Area_um': 'Area'})
+        writeTable(dfFoci[settings['outputFociColumnOrder']].sort_values(by=['cell ID']),
+                   os.path.join(workDirectory, settings['outputFociFileName']), settings['outputFormat'])
+        return outputDF
+
+    def visualizeTracking(data):
+        from trackOverlay import drawTracks
+
+        drawTracks(data, trackImageFileName, os.path.join(workDirectory, 'tracks.tif'))
+
+    results = []
+
+    def run(stage,function,makeArguments,rowsIn):
+        result, seconds, peakMB = measureStage(function, makeArguments, repeat, measureMemory)
+        rowsOut = len(result) if hasattr(result, '__len__') else None
+        results.append({'objects': int(nObjects), 'stage': stage, 'seconds': seconds, 'peakMB': peakMB, 'rowsIn': rowsIn, 'rowsOut': rowsOut})
+        print(f'{int(nObjects):>9} objects  {stage:<18} {seconds:9.4f} s' + (f'  {peakMB:9.1f} MB' if peakMB is not None else ''))
+        return result
+
+    df = run('ingest', ingest, lambda: (), 0)
+    df = run('calculateShape', shape, lambda: (df.copy(),), len(df))
+    cellIDs = run('stitchCells', stitchCells, lambda: (df,), len(df))
+    data = run('formatData', formatData, lambda: (df, cellIDs), len(df))
+    data = run('relativeTiming', relativeTiming, lambda: (data,), len(data))
+    data = run('findParents', findParents, lambda: (data.copy(),), len(data))
+    run('cellMetrics', summarizeCells, lambda: (data, settings['pixelConversion']), len(data))
+    dfFoci['cell ID'] = run('relateFociToCells', relateFociToCells, lambda: (data, dfFoci), len(dfFoci))
+    run('output', output, lambda: (data, dfFoci), len(data)+len(dfFoci))
+    if overlay:
+        trackImageFileName = os.path.join(workDirectory, 'phase.tif')
+        writeTrackImage(trackImageFileName, nFrames)
+        run('visualizeTracking', visualizeTracking, lambda: (data,), len(data))
+
+    for result in results:
+        result.update({'cells': int(data['cell ID'].nunique()), 'frames': nFrames, 'divisionRate': divisionRate})
+
+    return results
+
+
+def compareResults(results,baseline,threshold=1.2):
+    """
+    Compare the wall times of 'results' with the ones of 'baseline' for the same size and step.
+
+    This function returns the list of steps that took more than 'threshold' times as long as in the baseline.
+    """
+    before = {(result['objects'], result['stage']): result['seconds'] for result in baseline}
+    regressions = []
+    for result in results:
+        key = (result['objects'], result['stage'])
+        if key in before and before[key] > 0:
+            ratio = result['seconds']/before[key]
+            print(f"{result['objects']:>9} objects  {result['stage']:<18} {ratio:6.2f}x the baseline")
+            if ratio > threshold:
+                regressions.append(dict(result, baselineSeconds=before[key], ratio=ratio))
+
+    return regressions
+
+
+def main(arguments=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Time and memory-profile every step of CP_analysis on synthetic data.')
+    parser.add_argument('--objects', type=float, nargs='+', default=[1e3, 1e4, 1e5], help='approximate numbers of objects to benchmark')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--divisionRate', type=float, default=0.02)
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs of every step, the fastest is kept')
+    parser.add_argument('--memory', action=argparse.BooleanOptionalAction, default=True, help='measure the peak memory of every step')
+    parser.add_argument('--overlay', action=argparse.BooleanOptionalAction, default=True, help='also benchmark visualizeTracking')
+    parser.add_argument('--output', default='benchmark.json', help="'.json' file the results are saved to")
+    parser.add_argument('--baseline', help="'.json' file of an earlier benchmark to compare with")
+    parser.add_argument('--threshold', type=float, default=1.2, help='slow down over the baseline that counts as a regression')
+    parser.add_argument('--seed', type=int, default=0)
+    parsed = parser.parse_args(arguments)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workDirectory:
+        for nObjects in parsed.objects:
+            results += benchmarkSize(nObjects, parsed.frames, parsed.divisionRate, workDirectory, parsed.repeat, parsed.memory, parsed.overlay,
+                                     parsed.seed)
+
+    report = {'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                              'platform': platform.platform(), 'cpus': os.cpu_count(), 'date': time.strftime('%Y-%m-%d %H:%M:%S')},
+              'parameters': vars(parsed),
+              'results': results}
+    if parsed.baseline:
+        with open(parsed.baseline, 'r') as baselineFile:
+            baseline = json.load(baselineFile)['results']
+        report['regressions'] = compareResults(results, baseline, parsed.threshold)
+    with open(parsed.output, 'w') as outputFile:
+        json.dump(report, outputFile, indent=2)
+    print(f'Results saved to {parsed.output}')
+
+    if report.get('regressions'):
+        for regression in report['regressions']:
+            print(f"Regression: {regression['stage']} at {regression['objects']} objects is {regression['ratio']:.2f}x slower")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
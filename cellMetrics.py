@@ -0,0 +1,96 @@
+"""
+Growth and cell-cycle measurements of the cells-through-time, shared by 'CP_analysis_Version_006.py' and 'CP_analysis_GUI_Version_007.py'.
+
+All measurements are made with groupby transforms and aggregations over 'cell ID' (and sums for the fits), so no Python code is run once per
+cell. The mothers and daughters of the cells come from their lineageGraph.LineageGraph, which is how the birth of the daughters is found for the
+generation time.
+"""
+
+import numpy as np
+import pandas as pd
+
+from lineageGraph import LineageGraph
+
+
+#columns of the per-cell summary table, in the order they are saved
+summaryColumns = ['cell ID','Lineage','Generation','Mother','Daughters','Birth ImageNumber','Last ImageNumber','Instances',
+                  'Birth Time (hr)','Generation Time (hr)','Birth Area','Division Area','Added Area',
+                  'Growth Rate (1/hr)','Elongation Rate (um/hr)']
+
+
+def relativeTime(data,birthTimes=None):
+    """
+    This function returns the time of every instance of a cell-through-time since the first instance of that cell. 'birthTimes' can hold the
+    time of the first instance of cells that started before the rows in 'data', as a series indexed by 'cell ID'.
+    """
+    births = data.groupby('cell ID', sort=False)['Time (hr)'].transform('first')
+    if birthTimes is not None:
+        births = data['cell ID'].map(birthTimes).fillna(births)
+
+    return data['Time (hr)'] - births
+
+
+def fitSlopes(cellIDs,x,y):
+    """
+    Fit a straight line of 'y' against 'x' to the instances of every cell by least squares, leaving out values that are not finite.
+
+    This function returns the slope of every cell as a series indexed by 'cell ID', NaN for cells with less than two different 'x'.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y = x[finite], y[finite]
+    sums = pd.DataFrame({'n': 1.0, 'x': x, 'y': y, 'xx': x*x, 'xy': x*y}).groupby(np.asarray(cellIDs)[finite]).sum()
+    variance = sums['n']*sums['xx'] - sums['x']**2
+
+    return (sums['n']*sums['xy'] - sums['x']*sums['y']) / variance.where(variance > 1e-12)
+
+
+def summarizeCells(data,pixelConversion):
+    """
+    Summarize every cell-through-time in one row:
+    - 'Mother' and 'Daughters': the 'cell ID' of the cell it divided from and how many cells divided from it. 'Generation' is the number of
+      divisions since the start of its lineage.
+    - 'Birth Area' and 'Division Area': the area of its first and last instance, only given if the cell was born from a division and
+      divided itself, respectively. 'Added Area' is their difference.
+    - 'Generation Time (hr)': the time from its birth to the birth of its first daughter, only for cells born from a division.
+    - 'Growth Rate (1/hr)': the slope of log(area) against time, the exponential growth rate.
+    - 'Elongation Rate (um/hr)': the slope of the length ('AreaShape_MajorAxisLength' in um) against time.
+
+    'data' must hold every instance of the cells, with the tracking columns LineageGraph.fromTable needs.
+
+    This function returns the summary as a dataframe with one row per 'cell ID'.
+    """
+    cellIDs = data['cell ID'].to_numpy()
+    summary = data.groupby('cell ID', sort=True).agg(**{'Last ImageNumber': ('ImageNumber','last'),
+                                                         'Instances': ('ImageNumber','size'),
+                                                         'Birth Time (hr)': ('Time (hr)','first'),
+                                                         'Birth Area': ('AreaShape_Area_um','first'),
+                                                         'Division Area': ('AreaShape_Area_um','last')})
+    graph = LineageGraph.fromTable(data)
+    index = summary.index.to_numpy()
+    mothers = graph.parents[index]
+    summary['Lineage'] = graph.lineages[index]
+    summary['Birth ImageNumber'] = graph.birthFrames[index]
+    summary['Generation'] = graph.generations[index]
+    summary['Mother'] = pd.Series(mothers, index=summary.index, dtype='Int64').where(mothers > 0)
+    summary['Daughters'] = np.diff(graph.childOffsets)[index].astype(np.int64)
+    daughterBirths = summary['Birth Time (hr)'].reindex(graph.childCellIDs).groupby(graph.parents[graph.childCellIDs]).min()
+    born = summary['Mother'].notna()
+    divided = summary['Daughters'] > 0
+    summary['Generation Time (hr)'] = (daughterBirths.reindex(summary.index) - summary['Birth Time (hr)']).where(born)
+    summary['Birth Area'] = summary['Birth Area'].where(born)
+    summary['Division Area'] = summary['Division Area'].where(divided)
+    summary['Added Area'] = summary['Division Area'] - summary['Birth Area']
+
+    #the fits are made on the time since birth, which keeps the sums small
+    times = relativeTime(data).to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore'):
+        summary['Growth Rate (1/hr)'] = fitSlopes(cellIDs, times, np.log(data['AreaShape_Area_um'].to_numpy(dtype=np.float64)))
+    if 'AreaShape_MajorAxisLength' in data:
+        lengths = data['AreaShape_MajorAxisLength'].to_numpy(dtype=np.float64)*pixelConversion
+        summary['Elongation Rate (um/hr)'] = fitSlopes(cellIDs, times, lengths)
+    else:
+        summary['Elongation Rate (um/hr)'] = np.nan
+
+    return summary.rename_axis('cell ID').reset_index()[summaryColumns]
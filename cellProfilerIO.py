@@ -0,0 +1,349 @@
+"""
+Reading of the tables CellProfiler exports ('FilterCells.csv' and 'foci.csv').
+
+CellProfiler writes hundreds of measurement columns and pandas reads every one of them as float64 or object, even though only the
+requested output columns and the tracking and shape columns are ever used. The functions here work out which columns are actually needed,
+read only those and give them compact types: int32 for object numbers and other identifiers and float32 for measurements.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+#columns used by calculateShape, stitchCells, findParents and visualizeTracking
+cellTableColumns = ['ImageNumber','ObjectNumber',
+                    'TrackObjects_Label','TrackObjects_LinkType',
+                    'TrackObjects_ParentImageNumber','TrackObjects_ParentObjectNumber',
+                    'AreaShape_Area','AreaShape_MajorAxisLength','AreaShape_MinorAxisLength',
+                    'Location_Center_X','Location_Center_Y']
+#columns used by calculateShape and relateFociToCells
+fociTableColumns = ['ImageNumber','ObjectNumber','Parent_FilterCells',
+                    'AreaShape_Area','AreaShape_MajorAxisLength','AreaShape_MinorAxisLength',
+                    'Location_Center_X','Location_Center_Y']
+#CellProfiler columns renamed before saving the output '.csv'
+renamedColumns = {'TrackObjects_Label': 'Lineage',
+                  'AreaShape_Area_um': 'Area',
+                  'AreaShape_Solidity': 'Solidity',
+                  'AreaShape_FormFactor': 'Circularity'}
+#columns calculated by the analysis and the CellProfiler columns they are calculated from
+derivedColumns = {'AreaShape_Area_um': ['AreaShape_Area'],
+                  'Aspect Ratio': ['AreaShape_MajorAxisLength','AreaShape_MinorAxisLength'],
+                  'Shape': ['AreaShape_MajorAxisLength','AreaShape_MinorAxisLength'],
+                  'Time (hr)': ['ImageNumber'],
+                  'Relative Time': ['ImageNumber'],
+                  'Parent Area': ['AreaShape_Area']}
+
+
+def isIdentifierColumn(column):
+    """
+    This function returns True for the CellProfiler columns that hold object numbers, frame numbers, labels or counts.
+    """
+    return (column in ('ImageNumber','ObjectNumber')
+            or column.startswith(('TrackObjects_Label','TrackObjects_LinkType','TrackObjects_ParentImageNumber',
+                                  'TrackObjects_ParentObjectNumber','Parent_','Children_'))
+            or column.endswith('_Number_Object_Number'))
+
+
+def findNeededColumns(outputColumns,requiredColumns):
+    """
+    Work out which CellProfiler columns are needed to make 'outputColumns', following the renaming done before saving and the columns that are
+    calculated during the analysis.
+
+    This function returns the list of needed CellProfiler column names, the 'requiredColumns' first.
+    """
+    originalNames = {new: old for old, new in renamedColumns.items()}
+    needed = list(requiredColumns)
+    for column in outputColumns:
+        column = originalNames.get(column, column)
+        for source in derivedColumns.get(column, [column]):
+            if source not in needed:
+                needed.append(source)
+
+    return needed
+
+
+def findColumnTypes(fileName,outputColumns=None,requiredColumns=cellTableColumns):
+    """
+    Work out from the first rows of a CellProfiler '.csv' table which of its columns to read (see readCellProfilerTable) and their types.
+
+    This function returns the list of columns, a dictionary of {column: type} for the numeric ones and the sample of rows that was read.
+    """
+    sample = pd.read_csv(fileName, nrows=1000)
+    if outputColumns is None:
+        columns = list(sample.columns)
+    else:
+        columns = [column for column in findNeededColumns(outputColumns, requiredColumns) if column in sample.columns]
+
+    dtypes = {}
+    for column in columns:
+        if not pd.api.types.is_numeric_dtype(sample[column]):
+            continue
+        if isIdentifierColumn(column) and pd.api.types.is_integer_dtype(sample[column]):
+            dtypes[column] = np.int32
+        else:
+            dtypes[column] = np.float32
+
+    return columns, dtypes, sample
+
+
+def floatTypes(dtypes):
+    """
+    This function returns 'dtypes' with the int32 identifier columns read as float32 instead, for tables where they have missing values.
+    """
+    return {column: (np.float32 if dtype is np.int32 else dtype) for column, dtype in dtypes.items()}
+
+
+def readCellProfilerTable(fileName,outputColumns=None,requiredColumns=cellTableColumns):
+    """
+    Read a CellProfiler '.csv' table, keeping only the columns needed for 'outputColumns' plus 'requiredColumns'. If 'outputColumns' is None every
+    column is read, which is needed when the output columns are picked after the data is loaded. Identifier columns are read as int32 and all
+    other numeric columns as float32. Columns that are asked for but are not in the file are left out.
+
+    This function returns the new dataframe. The number of bytes saved compared to reading every column with the default types is printed and
+    stored in df.attrs['bytesSaved'].
+    """
+    columns, dtypes, sample = findColumnTypes(fileName, outputColumns, requiredColumns)
+    try:
+        df = pd.read_csv(fileName, usecols=columns, dtype=dtypes)
+    except ValueError:
+        #an identifier column has missing values further down the file, so it can not be read as an integer
+        df = pd.read_csv(fileName, usecols=columns, dtype=floatTypes(dtypes))
+
+    bytesUsed = int(df.memory_usage(deep=True).sum())
+    bytesPerRow = sample.memory_usage(deep=True, index=False).sum() / max(len(sample), 1)
+    bytesSaved = max(int(bytesPerRow*len(df)) - bytesUsed, 0)
+    df.attrs['bytesSaved'] = bytesSaved
+    print(f'Read {len(columns)} of {len(sample.columns)} columns from {os.path.basename(fileName)}: '
+          f'{bytesUsed/1e6:.2f} MB in memory, {bytesSaved/1e6:.2f} MB saved')
+
+    return df
+
+
+def readCellProfilerChunks(fileName,outputColumns=None,requiredColumns=cellTableColumns,chunkRows=100000):
+    """
+    Read a CellProfiler '.csv' table like readCellProfilerTable, but 'chunkRows' rows at a time so that the whole table is never in memory.
+
+    This function yields the chunks as dataframes, in the order of the file.
+    """
+    columns, dtypes, sample = findColumnTypes(fileName, outputColumns, requiredColumns)
+    rowsRead = 0
+    while True:
+        try:
+            with pd.read_csv(fileName, usecols=columns, dtype=dtypes, chunksize=chunkRows, skiprows=range(1, rowsRead+1)) as reader:
+                for chunk in reader:
+                    rowsRead += len(chunk)
+                    yield chunk
+            return
+        except ValueError:
+            if dtypes == floatTypes(dtypes):
+                raise
+            #an identifier column has missing values further down the file, the rest of it is read with float identifiers
+            dtypes = floatTypes(dtypes)
+
+
+class FrameReader:
+    """
+    Rows of a table sorted by 'ImageNumber', handed out a whole number of frames at a time from its 'chunks' (e.g. readCellProfilerChunks).
+    """
+
+    def __init__(self,chunks):
+        self.chunks = iter(chunks)
+        self.rows = None
+        self.finished = False
+        self.lastImageNumber = 0
+
+    def _read(self):
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.finished = True
+            return
+        imageNumbers = chunk['ImageNumber'].to_numpy()
+        if len(imageNumbers) and (imageNumbers[0] < self.lastImageNumber or np.any(imageNumbers[1:] < imageNumbers[:-1])):
+            raise ValueError("The table is not sorted by 'ImageNumber', it can only be read whole")
+        if len(imageNumbers):
+            self.lastImageNumber = imageNumbers[-1]
+        self.rows = chunk if self.rows is None else pd.concat([self.rows, chunk], ignore_index=True)
+
+    def _split(self,imageNumber):
+        position = int(np.searchsorted(self.rows['ImageNumber'].to_numpy(), imageNumber, side='right'))
+        frames = self.rows.iloc[:position]
+        self.rows = self.rows.iloc[position:].reset_index(drop=True)
+
+        return frames.reset_index(drop=True)
+
+    def next(self):
+        """
+        This function returns the rows of the next frames, read until at least one frame is complete, or None after the last frame.
+        """
+        while not self.finished and (self.rows is None or len(self.rows) == 0 or self.rows['ImageNumber'].iat[0] == self.lastImageNumber):
+            self._read()
+        if self.rows is None or len(self.rows) == 0:
+            return None
+        if self.finished:
+            frames, self.rows = self.rows.reset_index(drop=True), None
+            return frames
+
+        #the last frame read may go on in the next chunk
+        return self._split(self.lastImageNumber-1)
+
+    def until(self,imageNumber):
+        """
+        This function returns all rows up to and including frame 'imageNumber' that were not handed out yet.
+        """
+        while not self.finished and (self.rows is None or len(self.rows) == 0 or self.lastImageNumber <= imageNumber):
+            self._read()
+        if self.rows is None:
+            return None
+
+        return self._split(imageNumber)
+
+
+class TableWriter:
+    """
+    A table in 'outputFormat' ('csv', 'parquet' or 'feather') written a chunk of rows at a time with write(), so that it never has to be in
+    memory whole. Every chunk must have the same columns. The extension of 'fileName' is changed to match the format as in writeTable.
+    """
+
+    def __init__(self,fileName,outputFormat='csv'):
+        if outputFormat not in ('csv', 'parquet', 'feather'):
+            raise ValueError(f"Unknown output format '{outputFormat}', use 'csv', 'parquet' or 'feather'")
+        if outputFormat != 'csv':
+            fileName = os.path.splitext(fileName)[0]+'.'+outputFormat
+        self.fileName = fileName
+        self.outputFormat = outputFormat
+        self.rowsWritten = 0
+        self._writer = None
+        self._schema = None
+
+    def write(self,df):
+        """
+        Add the rows of 'df' to the end of the table.
+        """
+        if self.outputFormat == 'csv':
+            df.to_csv(self.fileName, mode='a' if self.rowsWritten else 'w', index=False, header=not self.rowsWritten)
+        else:
+            import pyarrow
+
+            if self._writer is None:
+                table = pyarrow.Table.from_pandas(df, preserve_index=False)
+                self._schema = table.schema
+                if self.outputFormat == 'parquet':
+                    from pyarrow import parquet
+                    self._writer = parquet.ParquetWriter(self.fileName, self._schema)
+                else:
+                    #an uncompressed Arrow IPC file is a Feather file readFeather can read through a memory map
+                    self._writer = pyarrow.ipc.new_file(self.fileName, self._schema)
+            else:
+                table = pyarrow.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            self._writer.write_table(table)
+        self.rowsWritten += len(df)
+
+    def close(self):
+        """
+        Finish the file. This function returns the name of the file written.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+        return self.fileName
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exception):
+        self.close()
+
+
+def writeTable(df,fileName,outputFormat='csv',sortColumns=('cell ID','ImageNumber')):
+    """
+    Save a table in the chosen 'outputFormat'. 'csv' writes the same '.csv' file as always. 'parquet' and 'feather' write columnar files that
+    can be loaded without parsing any text, sorted by the 'sortColumns' that are in the table. The extension of 'fileName' is changed to match the
+    format.
+
+    This function returns the name of the file written.
+    """
+    if outputFormat == 'csv':
+        df.to_csv(fileName, index=False, header=True)
+        return fileName
+
+    sortColumns = [column for column in sortColumns if column in df.columns]
+    if sortColumns:
+        df = df.sort_values(by=sortColumns, kind='stable')
+    fileName = os.path.splitext(fileName)[0]+'.'+outputFormat
+    if outputFormat == 'parquet':
+        df.to_parquet(fileName, index=False)
+    elif outputFormat == 'feather':
+        writeFeather(df, fileName)
+    else:
+        raise ValueError(f"Unknown output format '{outputFormat}', use 'csv', 'parquet' or 'feather'")
+
+    return fileName
+
+
+def appendTable(df,fileName,outputFormat='csv'):
+    """
+    Add the rows of 'df' to the end of a table saved by writeTable, or save a new table if there is none yet. '.csv' files are appended to in
+    place, 'parquet' and 'feather' files are read and saved again.
+
+    This function returns the name of the file written.
+    """
+    if outputFormat != 'csv':
+        fileName = os.path.splitext(fileName)[0]+'.'+outputFormat
+        if os.path.exists(fileName):
+            #copy the old rows out of the memory map before the file is written over
+            df = pd.concat([readTable(fileName).copy(), df], ignore_index=True)
+        return writeTable(df, fileName, outputFormat)
+    if not os.path.exists(fileName):
+        return writeTable(df, fileName, outputFormat)
+    df.to_csv(fileName, mode='a', index=False, header=False)
+
+    return fileName
+
+
+def readTable(fileName,columns=None,arrowBacked=False):
+    """
+    Load a table saved by writeTable, picking the reader from the extension of 'fileName'. 'arrowBacked' is passed on to readFeather.
+
+    This function returns the loaded dataframe.
+    """
+    extension = os.path.splitext(fileName)[1]
+    if extension == '.parquet':
+        return pd.read_parquet(fileName, columns=columns)
+    if extension == '.feather':
+        return readFeather(fileName, columns, arrowBacked)
+
+    return pd.read_csv(fileName, usecols=columns)
+
+
+def writeFeather(df,fileName):
+    """
+    Save a table as an uncompressed Feather (Arrow IPC) file. Uncompressed files are read by readFeather through a memory map, so only the
+    columns that are asked for are ever read from disk.
+    """
+    from pyarrow import Table, feather
+
+    feather.write_feather(Table.from_pandas(df, preserve_index=False), fileName, compression='uncompressed')
+
+
+def readFeather(fileName,columns=None,arrowBacked=False):
+    """
+    Load a Feather file written by writeFeather through a memory map, keeping only 'columns' if given. The columns read are copied into
+    ordinary numpy-backed columns. With 'arrowBacked' they are instead given pandas' Arrow types (e.g. 'double[pyarrow]') and stay in the
+    memory map without being copied, so a table bigger than memory can be loaded. The file can then not be written over while the dataframe
+    is in use.
+
+    This function returns the loaded dataframe.
+    """
+    import pyarrow
+
+    #selecting columns of the mapped table copies nothing, feather.read_table(columns=...) copies every column first
+    table = pyarrow.ipc.open_file(pyarrow.memory_map(fileName)).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    if arrowBacked:
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+    return table.to_pandas()
@@ -0,0 +1,93 @@
+"""
+Relations between the rows of the cells-through-time table, shared by 'CP_analysis_Version_006.py' and 'CP_analysis_GUI_Version_007.py'.
+
+Every object CellProfiler measures is uniquely identified by its ('ImageNumber', 'ObjectNumber') pair and every other table (parents through
+'TrackObjects_ParentImageNumber'/'TrackObjects_ParentObjectNumber') points back to it with the same pair. Instead of scanning the whole table
+for every row, the pairs are hashed once and all rows are looked up in a single keyed join.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def findObjectRows(data,imageNumbers,objectNumbers):
+    """
+    Look up the objects given by 'imageNumbers' and 'objectNumbers' in 'data' through its ('ImageNumber', 'ObjectNumber') keys.
+
+    This function returns an array with the position in 'data' of every object looked up, or -1 for objects that are not in 'data'.
+    """
+    objects = pd.MultiIndex.from_arrays([data['ImageNumber'].to_numpy(), data['ObjectNumber'].to_numpy()])
+    keys = pd.MultiIndex.from_arrays([np.asarray(imageNumbers), np.asarray(objectNumbers)])
+
+    return objects.get_indexer(keys)
+
+
+def takeRows(column,rows):
+    """
+    Take the values of 'column' at the positions 'rows', as returned by findObjectRows. Positions of -1 are given a missing value, integer
+    and boolean columns are turned into their nullable types so that they keep their type.
+
+    This function returns the taken values as a pandas array.
+    """
+    column = pd.Series(column.array)
+    if pd.api.types.is_bool_dtype(column.dtype):
+        column = column.astype('boolean')
+    elif pd.api.types.is_integer_dtype(column.dtype):
+        column = column.astype('Int64')
+
+    return column.reindex(rows).array
+
+
+def findParents(data,parentColumns=None,previousRows=None):
+    """
+    This function for any given instance of a cell-through-time, finds the parent, or mother, of that instance and records this as a new
+    column in the dataframe. It also records the area of the the parent. Other measurements of the parent can be recorded by giving
+    'parentColumns' as a dictionary of {new column name: column of the parent}, e.g. {'Parent Length': 'AreaShape_MajorAxisLength'}.
+    Instances without a parent are given a missing value. 'previousRows' can hold instances from frames that are not in 'data' (such as the
+    frontier of a StitcherState) that parents are also looked up in.
+
+    This function returns this updated version of the dataframe.
+    """
+    columns = {'Parent': 'cell ID', 'Parent Area': 'AreaShape_Area_um'}
+    if parentColumns:
+        columns.update(parentColumns)
+    parents = data
+    if previousRows is not None:
+        keep = ['ImageNumber','ObjectNumber'] + list(dict.fromkeys(columns.values()))
+        parents = pd.concat([data[keep], previousRows[keep]], ignore_index=True)
+    parentRows = findObjectRows(parents, data['TrackObjects_ParentImageNumber'], data['TrackObjects_ParentObjectNumber'])
+    for name, source in columns.items():
+        data[name] = takeRows(parents[source], parentRows)
+
+    return data
+
+
+def relateFociToCells(data,dfFoci,summarizeFoci=False,intensityColumn=None):
+    """
+    Every focus CellProfiler finds is related to the cell it sits in through its ('ImageNumber', 'Parent_FilterCells') pair. This function looks
+    up all foci in one keyed join and reports how many foci have no matching cell instead of stopping on them.
+
+    If 'summarizeFoci' is True, the number of foci of every instance of a cell-through-time and their mean position are recorded as the new
+    columns 'Foci Count', 'Foci Mean X' and 'Foci Mean Y' in 'data'. If 'intensityColumn' is also given, the sum of that column of 'dfFoci' is
+    recorded as 'Foci Total Intensity'.
+
+    This function returns the 'Cell ID' of every focus, with a missing value for foci that have no matching cell.
+    """
+    cellRows = findObjectRows(data, dfFoci['ImageNumber'], dfFoci['Parent_FilterCells'])
+    found = cellRows >= 0
+    orphans = len(cellRows) - np.count_nonzero(found)
+    if orphans:
+        print(f'Warning: {orphans} of {len(cellRows)} foci have no matching cell and were not assigned a cell ID')
+
+    if summarizeFoci:
+        rows = cellRows[found]
+        counts = np.bincount(rows, minlength=len(data))
+        data['Foci Count'] = counts
+        for name, column in (('Foci Mean X','Location_Center_X'), ('Foci Mean Y','Location_Center_Y')):
+            sums = np.bincount(rows, weights=dfFoci[column].to_numpy(dtype=np.float64)[found], minlength=len(data))
+            data[name] = np.where(counts > 0, sums/np.maximum(counts, 1), np.nan)
+        if intensityColumn is not None:
+            data['Foci Total Intensity'] = np.bincount(rows, weights=dfFoci[intensityColumn].to_numpy(dtype=np.float64)[found],
+                                                       minlength=len(data))
+
+    return takeRows(data['cell ID'], cellRows)
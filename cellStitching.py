@@ -0,0 +1,188 @@
+"""
+Stitching engine shared by 'CP_analysis_Version_006.py' and 'CP_analysis_GUI_Version_007.py'.
+
+CellProfiler links every object to its parent in the previous frame through the 'TrackObjects_ParentImageNumber' and
+'TrackObjects_ParentObjectNumber' columns. A cell-through-time starts at a row with a 'TrackObjects_LinkType' of 0 (new lineage) or 2 (split),
+or at the other daughter of a split (a 'TrackObjects_LinkType' of 1 that shares the parent of a split). Every other row continues the
+cell-through-time of its parent when it also has the same 'TrackObjects_Label'.
+
+Instead of scanning the whole table for every child and dropping rows as they are found, the rows are hashed once on
+('TrackObjects_ParentImageNumber', 'TrackObjects_ParentObjectNumber', 'TrackObjects_Label') and each cell-through-time is followed through
+that index, so every row is looked at a constant number of times.
+
+For timelapses that are still being acquired, a StitcherState keeps the last instance of every cell-through-time that has not divided (the
+frontier) and the next free 'Cell ID'. Stitching only the frames after the last processed one with that state continues the open cells and
+numbers the new ones after the old ones, so the 'Cell IDs' already given never change. The same state lets a table much bigger than memory be
+stitched a few frames at a time (see streamCPData in 'CP_analysis_Version_006.py').
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+
+class StitcherState:
+    """
+    What stitchCells needs to carry on with the frames after 'lastImageNumber'. 'frontier' holds the last instance of every open
+    cell-through-time with its 'ImageNumber', 'ObjectNumber', 'TrackObjects_Label', 'cell ID' and the 'Birth ImageNumber' it was first seen in,
+    plus the 'columns' later steps look up in the mothers of new cells. 'nextCellID' is the first 'Cell ID' not given yet.
+    """
+
+    keyColumns = ['ImageNumber','ObjectNumber','TrackObjects_Label','cell ID','Birth ImageNumber']
+
+    def __init__(self,frontier=None,nextCellID=1,lastImageNumber=0,columns=('AreaShape_Area_um',)):
+        self.columns = list(columns)
+        if frontier is None:
+            frontier = pd.DataFrame({column: np.zeros(0, dtype=np.int32) for column in self.keyColumns}
+                                    | {column: np.zeros(0, dtype=np.float32) for column in self.columns})
+        self.frontier = frontier
+        self.nextCellID = int(nextCellID)
+        self.lastImageNumber = int(lastImageNumber)
+
+    @classmethod
+    def load(cls,fileName):
+        """
+        This function returns the StitcherState saved in the '.json' file 'fileName'.
+        """
+        with open(fileName, 'r') as stateFile:
+            state = json.load(stateFile)
+        frontier = pd.DataFrame(state['frontier'])
+        frontier[cls.keyColumns] = frontier[cls.keyColumns].astype(np.int32)
+
+        return cls(frontier, state['nextCellID'], state['lastImageNumber'], state['columns'])
+
+    def save(self,fileName):
+        """
+        Save the state as a '.json' file so that the next run can carry on from it.
+        """
+        state = {'nextCellID': self.nextCellID, 'lastImageNumber': self.lastImageNumber, 'columns': self.columns,
+                 'frontier': {column: self.frontier[column].tolist() for column in self.frontier}}
+        with open(fileName, 'w') as stateFile:
+            json.dump(state, stateFile)
+
+    def birthFrames(self):
+        """
+        This function returns a Series of the 'Birth ImageNumber' of every open cell-through-time, indexed by 'Cell ID'.
+        """
+        return pd.Series(self.frontier['Birth ImageNumber'].to_numpy(), index=self.frontier['cell ID'].to_numpy())
+
+    def update(self,df,cellIDs,starts,lastRows,nextCellID):
+        """
+        Carry the state on past the rows of 'df' stitched by stitchCells. 'starts' are the positions of the rows that started new
+        cells-through-time and 'lastRows' the position of the last instance of every cell-through-time seen in 'df', by 'Cell ID'.
+        """
+        newCellIDs = np.fromiter(lastRows, dtype=np.int32, count=len(lastRows))
+        births = dict(zip(self.frontier['cell ID'].tolist(), self.frontier['Birth ImageNumber'].tolist()))
+        births.update(zip(cellIDs[starts].tolist(), df['ImageNumber'].to_numpy()[starts].tolist()))
+        rows = df.take(list(lastRows.values()))
+        lastInstances = pd.DataFrame({'ImageNumber': rows['ImageNumber'].to_numpy(np.int32),
+                                      'ObjectNumber': rows['ObjectNumber'].to_numpy(np.int32),
+                                      'TrackObjects_Label': rows['TrackObjects_Label'].to_numpy(np.int32),
+                                      'cell ID': newCellIDs,
+                                      'Birth ImageNumber': np.array([births[cellID] for cellID in lastRows], dtype=np.int32)})
+        for column in self.columns:
+            if column in rows:
+                lastInstances[column] = rows[column].to_numpy()
+        frontier = pd.concat([self.frontier[~self.frontier['cell ID'].isin(newCellIDs)], lastInstances], ignore_index=True)
+
+        #a mother is closed once one of its daughters starts a new cell-through-time
+        daughters = np.asarray(starts, dtype=np.int64)
+        daughters = daughters[df['TrackObjects_LinkType'].to_numpy()[daughters] != 0]
+        mothers = pd.MultiIndex.from_arrays([df['TrackObjects_ParentImageNumber'].to_numpy()[daughters],
+                                             df['TrackObjects_ParentObjectNumber'].to_numpy()[daughters]])
+        closed = pd.MultiIndex.from_arrays([frontier['ImageNumber'].to_numpy(), frontier['ObjectNumber'].to_numpy()]).isin(mothers)
+        self.frontier = frontier[~closed].reset_index(drop=True)
+        self.nextCellID = int(nextCellID)
+        if len(df):
+            self.lastImageNumber = max(self.lastImageNumber, int(df['ImageNumber'].max()))
+
+    def dropLostCells(self,imageNumber):
+        """
+        Close every open cell-through-time whose last instance is before frame 'imageNumber'. Tracking links only point to the frame before, so
+        when 'imageNumber' is the last frame stitched these cells were lost and can never be continued.
+        """
+        self.frontier = self.frontier[self.frontier['ImageNumber'] >= imageNumber].reset_index(drop=True)
+
+def stitchCells(df,state=None):
+    """
+    Give every instance of a cell-through-time the same unique 'Cell ID' number. The numbering is the same as the one given by the original
+    findStartingCells/findNextCell functions: lineage starts and splits are numbered first in the order they appear in the dataframe, followed by
+    the other daughters of each split, and every cell-through-time is then followed frame by frame through its children. When more than one child
+    matches, all of them are given the 'Cell ID' and the track is continued from the last one.
+
+    If a StitcherState is given, 'df' only holds the frames after the ones stitched before. The open cells-through-time of the state are continued
+    first, new ones are numbered from its 'nextCellID' and the state is updated to carry on after 'df'.
+
+    This function returns an integer array aligned with the rows of the input dataframe holding the 'Cell ID' of every row. Rows that could not
+    be connected to any cell-through-time are given a 'Cell ID' of 0.
+    """
+    linkType = df['TrackObjects_LinkType'].to_numpy()
+    imageNumber = df['ImageNumber'].tolist()
+    objectNumber = df['ObjectNumber'].tolist()
+    parentImageNumber = df['TrackObjects_ParentImageNumber'].tolist()
+    parentObjectNumber = df['TrackObjects_ParentObjectNumber'].tolist()
+    label = df['TrackObjects_Label'].tolist()
+
+    cellIDs = np.zeros(len(df), dtype=np.int32)
+    starts = np.flatnonzero((linkType == 0) | (linkType == 2))
+    firstCellID = state.nextCellID if state is not None else 1
+    cellIDs[starts] = np.arange(firstCellID, firstCellID+len(starts))
+    nextCellID = firstCellID+len(starts)
+    cellStarts = starts.tolist()
+
+    #only one daughter of a division gets the 'TrackObjects_LinkType' of 2, the other one keeps a 1 and shares the same parent
+    otherDaughters = {}
+    for position in np.flatnonzero(linkType == 1).tolist():
+        otherDaughters.setdefault((imageNumber[position], parentObjectNumber[position]), []).append(position)
+    for position in starts[linkType[starts] == 2].tolist():
+        for daughter in otherDaughters.pop((imageNumber[position], parentObjectNumber[position]), []):
+            cellIDs[daughter] = nextCellID
+            cellStarts.append(daughter)
+            nextCellID += 1
+
+    children = {}
+    for position in np.flatnonzero(cellIDs == 0).tolist():
+        children.setdefault((parentImageNumber[position], parentObjectNumber[position], label[position]), []).append(position)
+    lastRows = {}
+    if state is not None:
+        #the open cells of the state carry on from their last instance, which is not in 'df'
+        frontier = state.frontier
+        for key, cellID in zip(zip(frontier['ImageNumber'].tolist(), frontier['ObjectNumber'].tolist(),
+                                   frontier['TrackObjects_Label'].tolist()), frontier['cell ID'].tolist()):
+            nextCells = children.pop(key, None)
+            while nextCells:
+                cellIDs[nextCells] = cellID
+                current = nextCells[-1]
+                lastRows[cellID] = current
+                nextCells = children.pop((imageNumber[current], objectNumber[current], label[current]), None)
+    for position in cellStarts:
+        cellID = cellIDs[position]
+        current = position
+        nextCells = children.pop((imageNumber[current], objectNumber[current], label[current]), None)
+        while nextCells:
+            cellIDs[nextCells] = cellID
+            current = nextCells[-1]
+            nextCells = children.pop((imageNumber[current], objectNumber[current], label[current]), None)
+        lastRows[int(cellID)] = current
+
+    if state is not None:
+        state.update(df, cellIDs, cellStarts, lastRows, nextCellID)
+
+    return cellIDs
+
+
+def formatData(df,cellIDs):
+    """
+    This function takes the 'Cell ID' of every row found by stitchCells and converts the input dataframe into the cells-through-time dataframe,
+    where all instances of a cell-through-time follow each other in the order they were tracked. Rows that were not connected to any
+    cell-through-time are left out. The new dataframe is made with a single 'take' of the input rows so no per-row objects are created.
+
+    This function returns the new dataframe containing all the cells-through-time with their unique 'Cell ID' as a new column
+    """
+    tracked = np.flatnonzero(cellIDs > 0)
+    order = tracked[np.argsort(cellIDs[tracked], kind='stable')]
+    data = df.take(order)
+    data['cell ID'] = cellIDs[order]
+
+    return data
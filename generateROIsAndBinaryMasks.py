@@ -14,6 +14,8 @@ https://github.com/MouseLand/cellpose/blob/main/imagej_roi_converter.py
 
 It should be run in the imageJ macro window. A window will pop up asking for a directory. Please
 selected where the 'txt_outlines' folder generated from Omnipose
+
+'outlineMasks.py' and 'imagejRois.py' make the same binary masks and ROI '.zip' files without Fiji, from a terminal.
 """
 
 from ij import IJ, ImagePlus, ImageStack
@@ -0,0 +1,135 @@
+"""
+ImageJ ROI '.zip' files written straight from the outlines Omnipose saves in its 'txt_outlines' folder, without Fiji's RoiManager.
+
+'generateROIsAndBinaryMasks.py' adds every polygon of a frame to the RoiManager and saves them from there, which needs a running Fiji and gets
+slow with hundreds of cells per frame. Here every polygon is encoded in ImageJ's binary '.roi' format (a 64 byte big-endian header followed by
+the x and then the y coordinates as 16-bit integers relative to the bounding box) and the ROIs of a frame are zipped the way RoiManager saves
+them, so the files open in Fiji's RoiManager as before. Each frame gets its own '<name>_cp_outlines_ROIs.zip' next to the 'txt_outlines'
+folder, and the frames are written by a pool of worker processes. The outlines can also be read from an outline cache (see outlineCache.py).
+
+Run it with e.g.:
+    python imagejRois.py --outlineDirectory "C:\\Users\\bisso\\Desktop\\omniposeAnalysis\\txt_outlines" --workers 0
+"""
+
+import os
+import struct
+import zipfile
+
+import numpy as np
+from tqdm import tqdm
+
+from outlineCache import openOutlines
+from workerPool import mapChunks
+
+
+#version of the '.roi' format written, and the type ImageJ gives polygon ROIs
+roiVersion = 228
+polygonType = 0
+
+
+def encodePolygonRoi(polygon,position=0):
+    """
+    Encode a polygon of (n, 2) x, y points as an ImageJ polygon ROI. 'position' is the slice of a stack the ROI belongs to, 0 for none.
+
+    This function returns the bytes of the '.roi' file.
+    """
+    polygon = np.asarray(polygon, dtype=np.int64)
+    if len(polygon) > np.iinfo(np.uint16).max:
+        raise ValueError(f'A polygon of {len(polygon)} points is too long for an ImageJ ROI')
+    left, top = polygon.min(axis=0)
+    right, bottom = polygon.max(axis=0)
+    header = struct.pack('>4shBxhhhhH16xhiiihhbbhiI', b'Iout', roiVersion, polygonType, top, left, bottom, right, len(polygon),
+                         0, 0, 0, 0, 0, 0, 0, 0, 0, position, 0)
+    #the header is followed by all x and then all y coordinates, relative to the top left corner
+    coordinates = np.concatenate([polygon[:, 0]-left, polygon[:, 1]-top]).astype('>i2')
+
+    return header + coordinates.tobytes()
+
+
+def roiName(polygon):
+    """
+    This function returns the name RoiManager gives a ROI that is not on a stack: the y and x of the center of its bounding box, e.g. '0052-0117'.
+    """
+    polygon = np.asarray(polygon)
+    left, top = polygon.min(axis=0)
+    right, bottom = polygon.max(axis=0)
+
+    return f'{int(top + (bottom-top)//2):04d}-{int(left + (right-left)//2):04d}'
+
+
+def writeRoiZip(polygons,fileName):
+    """
+    Save 'polygons' as one ImageJ polygon ROI each in the '.zip' file 'fileName', which opens in Fiji's RoiManager. ROIs with the same name are
+    numbered like RoiManager does ('0052-0117-1').
+
+    This function returns the name of the file saved.
+    """
+    names = set()
+    with zipfile.ZipFile(fileName, 'w', zipfile.ZIP_DEFLATED) as roiZip:
+        for polygon in polygons:
+            if len(polygon) < 3:
+                continue
+            name = baseName = roiName(polygon)
+            copy = 1
+            while name in names:
+                name = f'{baseName}-{copy}'
+                copy += 1
+            names.add(name)
+            roiZip.writestr(name+'.roi', encodePolygonRoi(polygon))
+
+    return fileName
+
+
+def roiZipFileName(outlineFileName,outputDirectory=None):
+    """
+    This function returns the name the Fiji macro gives the ROI '.zip' of an outline file: '<name>_cp_outlines_ROIs.zip' next to 'txt_outlines',
+    or in 'outputDirectory' if given.
+    """
+    outlineDirectory, fileName = os.path.split(os.path.abspath(outlineFileName))
+
+    return os.path.join(outputDirectory or os.path.dirname(outlineDirectory), os.path.splitext(fileName)[0]+'_ROIs.zip')
+
+
+def _openState(state):
+    source, outputDirectory = state
+    return openOutlines(source), outputDirectory
+
+
+def _roiChunk(state,start,stop):
+    outlines, outputDirectory = state
+    for frame in range(start, stop):
+        yield writeRoiZip(outlines.polygons(frame), roiZipFileName(outlines.fileNames[frame], outputDirectory))
+
+
+def exportRois(outlineDirectory,outputDirectory=None,workers=1,chunkSize=8):
+    """
+    Save the ROIs of every outline file in 'outlineDirectory' as ImageJ ROI '.zip' files, next to the 'txt_outlines' folder unless an
+    'outputDirectory' is given. 'outlineDirectory' can also be an outline cache file (see outlineCache.py). With 'workers' above 1 (or 0/None
+    for one per CPU) the frames are written by a pool of processes, 'chunkSize' frames at a time (see workerPool.py).
+
+    This function returns the names of the files saved, in the order of the frames.
+    """
+    nFrames = len(openOutlines(outlineDirectory))
+    if not nFrames:
+        raise FileNotFoundError(f"No '.txt' outline files in {outlineDirectory}")
+    if outputDirectory:
+        os.makedirs(outputDirectory, exist_ok=True)
+    fileNames = mapChunks(_roiChunk, nFrames, (outlineDirectory, outputDirectory), workers, chunkSize, _openState)
+
+    return list(tqdm(fileNames, total=nFrames))
+
+
+def main(arguments=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Save the outlines of an Omnipose 'txt_outlines' folder as ImageJ ROI '.zip' files.")
+    parser.add_argument('--outlineDirectory', required=True, help="the 'txt_outlines' folder generated by Omnipose, or an outline cache file")
+    parser.add_argument('--outputDirectory', help="folder to save the '.zip' files to, by default the one holding 'txt_outlines'")
+    parser.add_argument('--workers', type=int, default=1, help='number of processes writing files, 0 to use every CPU')
+    parsed = parser.parse_args(arguments)
+
+    fileNames = exportRois(parsed.outlineDirectory, parsed.outputDirectory, parsed.workers)
+    print(f'{len(fileNames)} ROI files saved')
+
+if __name__ == '__main__':
+    main()
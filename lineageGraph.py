@@ -0,0 +1,157 @@
+"""
+Compact lineage graph of cells-through-time.
+
+Once every row of the CellProfiler table has been given a 'Cell ID' by cellStitching.stitchCells, each cell-through-time becomes one node of a
+lineage tree. The mother of a cell-through-time is found from the 'TrackObjects_ParentImageNumber' and 'TrackObjects_ParentObjectNumber' of
+its first instance, unless that instance starts a new lineage ('TrackObjects_LinkType' of 0). The daughters of every cell are stored in
+compressed sparse row (CSR) form, so the whole graph is held in a handful of int32 arrays (24 bytes per cell-through-time) and can be queried
+without going back to the dataframe.
+
+All arrays are indexed directly by 'Cell ID'. 'Cell ID' 0 is never given to a cell and is used to mean "no cell". cellMetrics.summarizeCells
+takes the lineage, generation, mother and daughters of every cell of the cell summary from it.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class LineageGraph:
+    """
+    Parent/daughter relationships between cells-through-time.
+
+    parents[cellID] is the 'Cell ID' of the mother (0 for cells that start a lineage), lineages[cellID] the 'TrackObjects_Label',
+    generations[cellID] the number of divisions since the start of the lineage and birthFrames[cellID] the 'ImageNumber' the cell was first
+    seen in. The daughters of a cell are childCellIDs[childOffsets[cellID]:childOffsets[cellID+1]].
+    """
+
+    def __init__(self,parents,lineages,birthFrames):
+        self.parents = np.asarray(parents, dtype=np.int32)
+        self.lineages = np.asarray(lineages, dtype=np.int32)
+        self.birthFrames = np.asarray(birthFrames, dtype=np.int32)
+
+        #daughters are sorted by mother so that each cell's daughters sit next to each other
+        daughters = np.flatnonzero(self.parents > 0)
+        order = np.argsort(self.parents[daughters], kind='stable')
+        self.childCellIDs = daughters[order].astype(np.int32)
+        counts = np.bincount(self.parents[daughters], minlength=len(self.parents))
+        self.childOffsets = np.zeros(len(self.parents)+1, dtype=np.int32)
+        np.cumsum(counts, out=self.childOffsets[1:])
+
+        self.generations = self._findGenerations()
+
+    @classmethod
+    def fromTable(cls,df,cellIDs=None):
+        """
+        Build the lineage graph from the CellProfiler table. 'cellIDs' is the array returned by stitchCells and is aligned with the rows of
+        'df'. If it is not given the 'cell ID' column of 'df' is used instead.
+
+        This function returns the new LineageGraph.
+        """
+        if cellIDs is None:
+            cellIDs = df['cell ID'].to_numpy()
+        cellIDs = np.asarray(cellIDs, dtype=np.int64)
+        imageNumber = df['ImageNumber'].to_numpy()
+        objectNumber = df['ObjectNumber'].to_numpy()
+
+        #the first instance of every cell-through-time is the one found in the earliest frame
+        tracked = np.flatnonzero(cellIDs > 0)
+        order = tracked[np.lexsort((imageNumber[tracked], cellIDs[tracked]))]
+        isFirst = np.ones(len(order), dtype=bool)
+        isFirst[1:] = cellIDs[order[1:]] != cellIDs[order[:-1]]
+        firstRows = order[isFirst]
+        firstCellIDs = cellIDs[firstRows]
+
+        nCells = int(cellIDs.max()) + 1 if len(tracked) else 1
+        parents = np.zeros(nCells, dtype=np.int32)
+        lineages = np.zeros(nCells, dtype=np.int32)
+        birthFrames = np.zeros(nCells, dtype=np.int32)
+        lineages[firstCellIDs] = df['TrackObjects_Label'].to_numpy()[firstRows]
+        birthFrames[firstCellIDs] = imageNumber[firstRows]
+
+        objects = pd.MultiIndex.from_arrays([imageNumber, objectNumber])
+        parentRows = objects.get_indexer(pd.MultiIndex.from_arrays([df['TrackObjects_ParentImageNumber'].to_numpy()[firstRows],
+                                                                    df['TrackObjects_ParentObjectNumber'].to_numpy()[firstRows]]))
+        hasParent = (parentRows >= 0) & (df['TrackObjects_LinkType'].to_numpy()[firstRows] != 0)
+        parents[firstCellIDs[hasParent]] = cellIDs[parentRows[hasParent]]
+        #a cell can not be its own mother, this only happens when a row was stitched to a cell it does not belong to
+        parents[parents == np.arange(nCells)] = 0
+
+        return cls(parents, lineages, birthFrames)
+
+    def _findGenerations(self):
+        #pointer jumping: every pass doubles how far up the tree each cell has looked, so this takes log(generations) passes
+        generations = (self.parents > 0).astype(np.int32)
+        jump = self.parents.copy()
+        active = np.flatnonzero(jump > 0)
+        while len(active):
+            generations[active] += generations[jump[active]]
+            jump[active] = jump[jump[active]]
+            active = active[jump[active] > 0]
+
+        return generations
+
+    def __len__(self):
+        return int(np.count_nonzero(self.birthFrames))
+
+    @property
+    def nbytes(self):
+        return (self.parents.nbytes + self.lineages.nbytes + self.birthFrames.nbytes + self.generations.nbytes
+                + self.childCellIDs.nbytes + self.childOffsets.nbytes)
+
+    def parent(self,cellID):
+        """
+        This function returns the 'Cell ID' of the mother of a cell, or 0 if the cell started its lineage.
+        """
+        return int(self.parents[cellID])
+
+    def children(self,cellID):
+        """
+        This function returns an array of the 'Cell IDs' of the daughters of a cell.
+        """
+        return self.childCellIDs[self.childOffsets[cellID]:self.childOffsets[cellID+1]]
+
+    def sister(self,cellID):
+        """
+        This function returns the 'Cell ID' of the other daughter of the same division, or 0 if the cell has no sister.
+        """
+        mother = self.parents[cellID]
+        if mother == 0:
+            return 0
+        sisters = self.children(mother)
+        sisters = sisters[sisters != cellID]
+
+        return int(sisters[0]) if len(sisters) else 0
+
+    def generation(self,cellID):
+        """
+        This function returns the number of divisions between the start of the lineage and the cell.
+        """
+        return int(self.generations[cellID])
+
+    def ancestors(self,cellID):
+        """
+        This function returns an array of the 'Cell IDs' of the mother, grandmother, ... of a cell, from the closest to the oldest.
+        """
+        ancestors = np.empty(self.generations[cellID], dtype=np.int32)
+        cellID = self.parents[cellID]
+        for i in range(len(ancestors)):
+            ancestors[i] = cellID
+            cellID = self.parents[cellID]
+
+        return ancestors
+
+    def descendants(self,cellID):
+        """
+        This function returns an array of the 'Cell IDs' of every cell descended from a cell, one generation after the other.
+        """
+        descendants = []
+        generation = self.children(cellID)
+        while len(generation):
+            descendants.append(generation)
+            starts = self.childOffsets[generation]
+            counts = self.childOffsets[generation+1] - starts
+            #gather the daughters of the whole generation at once
+            positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            generation = self.childCellIDs[positions]
+
+        return np.concatenate(descendants) if descendants else np.empty(0, dtype=np.int32)
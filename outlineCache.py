@@ -0,0 +1,185 @@
+"""
+A compact binary copy of an Omnipose 'txt_outlines' folder that loads in milliseconds.
+
+The '*_cp_outlines.txt' files are text with one polygon per line, and reading them means parsing every number again each time masks or ROIs
+are made. buildOutlineCache() parses the folder once and saves every polygon of every frame in one file:
+- 'coordinates': the x, y points of all polygons one after the other, as an (n, 2) int32 array
+- 'polygonOffsets': where every polygon starts in 'coordinates' (int64, one more than the number of polygons)
+- 'frameOffsets': where every frame starts in 'polygonOffsets' (int64, one more than the number of frames)
+- 'frameNumbers': the frame number each outline file name starts with (int32, -1 if it has none)
+The arrays are written raw and 64-byte aligned, followed by a '.json' header with their positions, the outline file names and the size of the
+segmented images, and a 24 byte trailer pointing to the header. OutlineCache.load() memory-maps the arrays, so only the frames used are read.
+
+outlineMasks.py and imagejRois.py take the cache file wherever they take a 'txt_outlines' folder. Build it with e.g.:
+    python outlineCache.py --outlineDirectory "C:\\Users\\bisso\\Desktop\\omniposeAnalysis\\txt_outlines"
+"""
+
+import os
+import json
+import struct
+
+import numpy as np
+
+from outlineMasks import findOutlineFiles, readOutlines, frameNumber, findImageFile, imageShape
+
+
+#first and last bytes of a cache file, and the version of its layout
+cacheMagic = b'OUTLINES'
+cacheVersion = 1
+
+
+class OutlineCache:
+    """
+    The polygons of every frame of an outline cache file, memory-mapped by load().
+    """
+
+    def __init__(self,fileNames,coordinates,polygonOffsets,frameOffsets,frameNumbers,shape=None):
+        self.fileNames = list(fileNames)
+        self.coordinates = coordinates
+        self.polygonOffsets = polygonOffsets
+        self.frameOffsets = frameOffsets
+        self.frameNumbers = frameNumbers
+        self.shape = tuple(shape) if shape else None
+
+    @classmethod
+    def load(cls,fileName):
+        """
+        This function returns the OutlineCache saved in 'fileName', with its arrays memory-mapped.
+        """
+        with open(fileName, 'rb') as cacheFile:
+            cacheFile.seek(-24, os.SEEK_END)
+            headerOffset, headerLength, magic = struct.unpack('<QQ8s', cacheFile.read(24))
+            if magic != cacheMagic:
+                raise ValueError(f'{fileName} is not an outline cache')
+            cacheFile.seek(headerOffset)
+            header = json.loads(cacheFile.read(headerLength))
+        if header['version'] != cacheVersion:
+            raise ValueError(f"{fileName} is version {header['version']} of the outline cache, this script reads version {cacheVersion}")
+        arrays = {}
+        for name, (offset, dtype, shape) in header['arrays'].items():
+            if np.prod(shape) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(fileName, dtype=dtype, mode='r', offset=offset, shape=tuple(shape))
+
+        return cls(header['fileNames'], shape=header['shape'], **arrays)
+
+    def __len__(self):
+        return len(self.fileNames)
+
+    def polygonCount(self,frame):
+        """
+        This function returns the number of polygons of the frame at position 'frame'.
+        """
+        return int(self.frameOffsets[frame+1] - self.frameOffsets[frame])
+
+    def polygons(self,frame):
+        """
+        This function returns the polygons of the frame at position 'frame', as a list of (n, 2) int32 arrays like readOutlines.
+        """
+        offsets = self.polygonOffsets[self.frameOffsets[frame]:self.frameOffsets[frame+1]+1]
+        if len(offsets) < 2:
+            return []
+        points = self.coordinates[offsets[0]:offsets[-1]]
+
+        return np.split(points, offsets[1:-1] - offsets[0])
+
+
+class OutlineFolder:
+    """
+    The outline files of a 'txt_outlines' folder, with the same interface as OutlineCache. The files are only read when their polygons are asked
+    for.
+    """
+
+    def __init__(self,outlineDirectory,timelapse=True):
+        self.fileNames = findOutlineFiles(outlineDirectory, timelapse)
+        self.shape = None
+
+    def __len__(self):
+        return len(self.fileNames)
+
+    def polygons(self,frame):
+        """
+        This function returns the polygons of the frame at position 'frame', read from its outline file.
+        """
+        return readOutlines(self.fileNames[frame])
+
+
+def openOutlines(source,timelapse=True):
+    """
+    This function returns an OutlineCache if 'source' is an outline cache file and an OutlineFolder if it is a 'txt_outlines' folder.
+    """
+    if os.path.isfile(source):
+        return OutlineCache.load(source)
+
+    return OutlineFolder(source, timelapse)
+
+
+def _align(outputFile):
+    outputFile.write(b'\0' * (-outputFile.tell() % 64))
+
+    return outputFile.tell()
+
+
+def buildOutlineCache(outlineDirectory,cacheFileName=None,timelapse=True):
+    """
+    Parse every outline file of 'outlineDirectory' once and save the polygons as an outline cache, by default 'outlines.bin' next to the
+    'txt_outlines' folder. The coordinates are written frame by frame, so the folder is never in memory whole.
+
+    This function returns the name of the file saved.
+    """
+    fileNames = findOutlineFiles(outlineDirectory, timelapse)
+    if not fileNames:
+        raise FileNotFoundError(f"No '.txt' outline files in {outlineDirectory}")
+    if cacheFileName is None:
+        cacheFileName = os.path.join(os.path.dirname(os.path.abspath(outlineDirectory)), 'outlines.bin')
+    try:
+        shape = imageShape(findImageFile(fileNames[0]))
+    except (OSError, ValueError):
+        shape = None
+
+    polygonLengths = []
+    frameCounts = []
+    temporaryFileName = cacheFileName + '.tmp'
+    with open(temporaryFileName, 'wb') as cacheFile:
+        cacheFile.write(cacheMagic)
+        coordinatesOffset = _align(cacheFile)
+        for fileName in fileNames:
+            polygons = readOutlines(fileName)
+            frameCounts.append(len(polygons))
+            polygonLengths += [len(polygon) for polygon in polygons]
+            if polygons:
+                cacheFile.write(np.concatenate(polygons).astype('<i4').tobytes())
+        polygonOffsets = np.concatenate([[0], np.cumsum(polygonLengths, dtype=np.int64)])
+        frameOffsets = np.concatenate([[0], np.cumsum(frameCounts, dtype=np.int64)])
+        frameNumbers = np.array([-1 if frameNumber(fileName) is None else frameNumber(fileName) for fileName in fileNames], dtype='<i4')
+        arrays = {'coordinates': [coordinatesOffset, '<i4', [int(polygonOffsets[-1]), 2]]}
+        for name, array in (('polygonOffsets', polygonOffsets.astype('<i8')), ('frameOffsets', frameOffsets.astype('<i8')),
+                            ('frameNumbers', frameNumbers)):
+            arrays[name] = [_align(cacheFile), array.dtype.str, list(array.shape)]
+            cacheFile.write(array.tobytes())
+        header = json.dumps({'version': cacheVersion, 'fileNames': [os.path.abspath(fileName) for fileName in fileNames], 'shape': shape,
+                             'arrays': arrays}).encode()
+        headerOffset = cacheFile.tell()
+        cacheFile.write(header)
+        cacheFile.write(struct.pack('<QQ8s', headerOffset, len(header), cacheMagic))
+    os.replace(temporaryFileName, cacheFileName)
+
+    return cacheFileName
+
+
+def main(arguments=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Save the outlines of an Omnipose 'txt_outlines' folder as one binary file that loads fast.")
+    parser.add_argument('--outlineDirectory', required=True, help="the 'txt_outlines' folder generated by Omnipose")
+    parser.add_argument('--output', help="file to save, by default 'outlines.bin' next to the 'txt_outlines' folder")
+    parser.add_argument('--timelapse', action=argparse.BooleanOptionalAction, default=True, help='sort the frames by the number they start with')
+    parsed = parser.parse_args(arguments)
+
+    cacheFileName = buildOutlineCache(parsed.outlineDirectory, parsed.output, parsed.timelapse)
+    cache = OutlineCache.load(cacheFileName)
+    print(f'{len(cache)} frames and {len(cache.polygonOffsets)-1} outlines saved to {cacheFileName}')
+
+if __name__ == '__main__':
+    main()
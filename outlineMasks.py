@@ -0,0 +1,247 @@
+"""
+Binary and label masks made straight from the outlines Omnipose saves in its 'txt_outlines' folder, without Fiji.
+
+This does what 'generateROIsAndBinaryMasks.py' does in the Fiji macro window, from a terminal or on a cluster node. Every '*_cp_outlines.txt'
+file holds one polygon per line as "x1,y1,x2,y2,...". The polygons of a frame are filled the way ImageJ fills a polygon ROI (every pixel whose
+center is inside the polygon, with the even-odd rule) into a frame of 0 the size of the image Omnipose segmented, giving 0/255 masks. Unless
+'foci' is set, the masks are then eroded once like Fiji's Process > Binary > Erode so touching cells come apart.
+
+With 'labels' the polygons are filled with their number in the outline file instead (1 for the first line, the same order as Omnipose's mask
+IDs) into a uint16 label stack. CellProfiler can load it as objects directly, so touching cells stay apart without eroding, thresholding or
+declumping them again.
+
+The frames are made by a pool of worker processes and written in order straight to a '.tif' stack, so only a few frames are ever in memory.
+The outlines can also be read from an outline cache made by outlineCache.py instead of the folder.
+
+Run it with e.g.:
+    python outlineMasks.py --outlineDirectory "C:\\Users\\bisso\\Desktop\\omniposeAnalysis\\txt_outlines" --output phase_binaryMasks.tif
+"""
+
+import os
+import re
+
+import numpy as np
+import tifffile
+from tqdm import tqdm
+
+from workerPool import mapChunks
+
+
+def frameNumber(fileName):
+    """
+    This function returns the frame number at the start of an Omnipose file name (e.g. 12 for '12_phase_cp_outlines.txt'), or None.
+    """
+    match = re.search(r'^(\d+)_', os.path.basename(fileName))
+
+    return int(match.group(1)) if match else None
+
+
+def findOutlineFiles(outlineDirectory,timelapse=True):
+    """
+    This function returns the paths of the '.txt' outline files in 'outlineDirectory', sorted by their frame number for a timelapse and by name
+    otherwise.
+    """
+    files = sorted(fileName for fileName in os.listdir(outlineDirectory) if fileName.endswith('.txt'))
+    if timelapse:
+        files.sort(key=frameNumber)
+
+    return [os.path.join(outlineDirectory, fileName) for fileName in files]
+
+
+def findImageFile(outlineFileName):
+    """
+    This function returns the path of the image Omnipose segmented to make 'outlineFileName', which sits in the folder above 'txt_outlines'.
+    """
+    outlineDirectory, fileName = os.path.split(os.path.abspath(outlineFileName))
+
+    return os.path.join(os.path.dirname(outlineDirectory), fileName.split('_cp')[0]+'.tif')
+
+
+def imageShape(fileName):
+    """
+    This function returns the (height, width) of the first frame of a '.tif' image without reading its pixels.
+    """
+    with tifffile.TiffFile(fileName) as tif:
+        return tuple(tif.pages[0].shape[:2])
+
+
+def readOutlines(fileName):
+    """
+    This function returns the polygons of an Omnipose outline '.txt' file, as a list of (n, 2) int32 arrays of x, y points.
+    """
+    polygons = []
+    with open(fileName, 'r') as textFile:
+        for line in textFile:
+            line = line.strip()
+            if line:
+                polygons.append(np.array(line.split(','), dtype=np.int32).reshape(-1, 2))
+
+    return polygons
+
+
+def polygonSpans(polygons,shape):
+    """
+    Work out which pixels are inside each polygon, row by row: a pixel is inside when its center (x+0.5, y+0.5) is, using the even-odd rule.
+    All polygons of a frame are done together, with one crossing per polygon edge and row.
+
+    This function returns the polygon (its position in 'polygons'), row, first column and column after the last of every run of inside pixels,
+    clipped to 'shape'.
+    """
+    height, width = shape
+    empty = np.zeros(0, dtype=np.int64)
+    kept = np.array([i for i, polygon in enumerate(polygons) if len(polygon) >= 3], dtype=np.int64)
+    polygons = [polygons[i] for i in kept]
+    if not polygons:
+        return empty, empty, empty, empty
+    points = np.concatenate(polygons).astype(np.float64)
+    lengths = np.array([len(polygon) for polygon in polygons])
+    first = np.cumsum(lengths) - lengths
+    edgePolygon = np.repeat(np.arange(len(polygons)), lengths)
+    #every point is joined to the next one of its polygon, the last one back to the first
+    following = np.arange(len(points)) + 1
+    following[first + lengths - 1] = first
+    x0, y0 = points[:, 0], points[:, 1]
+    x1, y1 = points[following, 0], points[following, 1]
+
+    #an edge crosses the centers of the rows from ceil(min(y)-0.5) to ceil(max(y)-0.5)-1
+    rowStart = np.ceil(np.minimum(y0, y1) - 0.5).astype(np.int64)
+    rowStop = np.ceil(np.maximum(y0, y1) - 0.5).astype(np.int64)
+    counts = np.maximum(rowStop - rowStart, 0)
+    edges = np.repeat(np.arange(len(points)), counts)
+    rows = rowStart[edges] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    crossings = x0[edges] + (rows + 0.5 - y0[edges]) * (x1[edges] - x0[edges]) / (y1[edges] - y0[edges])
+    crossingPolygon = edgePolygon[edges]
+
+    #every row of a closed polygon is crossed an even number of times, the pixels between each pair of crossings are inside
+    order = np.lexsort((crossings, rows, crossingPolygon))
+    crossings, rows, crossingPolygon = crossings[order], rows[order], crossingPolygon[order]
+    starts = np.clip(np.ceil(crossings[0::2] - 0.5).astype(np.int64), 0, width)
+    stops = np.clip(np.ceil(crossings[1::2] - 0.5).astype(np.int64), 0, width)
+    rows, spanPolygon = rows[0::2], crossingPolygon[0::2]
+    keep = (stops > starts) & (rows >= 0) & (rows < height)
+
+    return kept[spanPolygon[keep]], rows[keep], starts[keep], stops[keep]
+
+
+def rasterizePolygons(polygons,shape,value=255,dtype=np.uint8):
+    """
+    Fill 'polygons' with 'value' into a frame of zeros of 'shape'. 'value' can also hold one value per polygon, where polygons overlap the
+    later one wins.
+
+    This function returns the filled frame.
+    """
+    frame = np.zeros(shape, dtype=dtype)
+    spanPolygon, rows, starts, stops = polygonSpans(polygons, shape)
+    lengths = stops - starts
+    pixels = np.repeat(rows*shape[1] + starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+    value = np.asarray(value)
+    frame.ravel()[pixels] = value if value.ndim == 0 else np.repeat(value[spanPolygon], lengths)
+
+    return frame
+
+
+def erode(mask):
+    """
+    Erode a 0/255 mask once the way Fiji's Process > Binary > Erode does: a foreground pixel is cleared when any of its 8 neighbors is
+    background, and pixels outside the frame count as background.
+
+    This function returns the eroded mask.
+    """
+    padded = np.pad(mask > 0, 1, constant_values=False)
+    height, width = mask.shape
+    kept = np.ones(mask.shape, dtype=bool)
+    for dy in range(3):
+        for dx in range(3):
+            kept &= padded[dy:dy+height, dx:dx+width]
+
+    return np.where(kept, mask, 0).astype(mask.dtype)
+
+
+def drawMask(polygons,shape,foci=False,labels=False):
+    """
+    Make the 0/255 mask of one frame from its polygons. The mask is eroded once unless 'foci' is True. With 'labels' every polygon is filled
+    with its number (from 1) instead and nothing is eroded.
+
+    This function returns the (height, width) uint8 mask, or uint16 label mask.
+    """
+    if labels:
+        if len(polygons) > np.iinfo(np.uint16).max:
+            raise ValueError(f'A frame has {len(polygons)} outlines, too many for a uint16 label mask')
+        return rasterizePolygons(polygons, shape, np.arange(1, len(polygons)+1), np.uint16)
+    mask = rasterizePolygons(polygons, shape)
+    if not foci:
+        mask = erode(mask)
+
+    return mask
+
+
+def makeMask(outlineFileName,shape=None,foci=False,labels=False):
+    """
+    Make the mask of one frame from its outline file (see drawMask). 'shape' is taken from the image Omnipose segmented if it is not given.
+
+    This function returns the (height, width) uint8 mask, or uint16 label mask.
+    """
+    shape = shape or imageShape(findImageFile(outlineFileName))
+
+    return drawMask(readOutlines(outlineFileName), shape, foci, labels)
+
+
+def _openState(state):
+    from outlineCache import openOutlines
+
+    source, timelapse, shape, foci, labels = state
+    return openOutlines(source, timelapse), shape, foci, labels
+
+
+def _maskChunk(state,start,stop):
+    outlines, shape, foci, labels = state
+    for frame in range(start, stop):
+        yield drawMask(outlines.polygons(frame), shape, foci, labels)
+
+
+def generateMasks(outlineDirectory,outputFileName=None,timelapse=True,foci=False,shape=None,workers=1,chunkSize=8,labels=False):
+    """
+    Make the mask of every outline file in 'outlineDirectory' and save them in order as one '.tif' stack, by default 'binaryMasks.tif' (or
+    'labelMasks.tif' with 'labels') next to the 'txt_outlines' folder. 'outlineDirectory' can also be an outline cache file (see
+    outlineCache.py). All frames must be the size of the first image Omnipose segmented, or of 'shape' if given.
+
+    With 'workers' above 1 (or 0/None for one per CPU) the frames are made by a pool of processes, 'chunkSize' frames at a time (see
+    workerPool.py). Every process opens the outlines itself.
+
+    This function returns the name of the file saved.
+    """
+    from outlineCache import openOutlines
+
+    outlines = openOutlines(outlineDirectory, timelapse)
+    if not len(outlines):
+        raise FileNotFoundError(f"No '.txt' outline files in {outlineDirectory}")
+    if outputFileName is None:
+        outputFileName = os.path.join(os.path.dirname(os.path.abspath(outlineDirectory)), 'labelMasks.tif' if labels else 'binaryMasks.tif')
+    shape = tuple(shape or outlines.shape or imageShape(findImageFile(outlines.fileNames[0])))
+    nFrames = len(outlines)
+    masks = mapChunks(_maskChunk, nFrames, (outlineDirectory, timelapse, shape, foci, labels), workers, chunkSize, _openState)
+    tifffile.imwrite(outputFileName, iter(tqdm(masks, total=nFrames)), shape=(nFrames,)+shape, dtype=np.uint16 if labels else np.uint8,
+                     imagej=True, metadata={'axes': 'TYX'})
+
+    return outputFileName
+
+
+def main(arguments=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Make a binary mask stack from the 'txt_outlines' folder Omnipose saves, without Fiji.")
+    parser.add_argument('--outlineDirectory', required=True, help="the 'txt_outlines' folder generated by Omnipose, or an outline cache file")
+    parser.add_argument('--output', help="'.tif' stack to save, by default 'binaryMasks.tif' next to the 'txt_outlines' folder")
+    parser.add_argument('--timelapse', action=argparse.BooleanOptionalAction, default=True, help='sort the frames by the number they start with')
+    parser.add_argument('--foci', action=argparse.BooleanOptionalAction, default=False, help='masks of foci, which are not eroded')
+    parser.add_argument('--shape', type=int, nargs=2, metavar=('HEIGHT', 'WIDTH'), help='frame size if the segmented images are not there')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes making masks, 0 to use every CPU')
+    parser.add_argument('--labels', action='store_true', help='save a uint16 label stack with one number per outline instead of 0/255 masks')
+    parsed = parser.parse_args(arguments)
+
+    outputFileName = generateMasks(parsed.outlineDirectory, parsed.output, parsed.timelapse, parsed.foci, parsed.shape, parsed.workers,
+                                   labels=parsed.labels)
+    print(f'Masks saved to {outputFileName}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Timing and memory report of the steps of a CP_analysis run.
+
+Every step of analyzeCPData is run inside RunReport.stage(), which records its wall time, CPU time (including finished worker processes),
+the peak resident memory (RSS) of the process while it ran and the number of rows going in and out. Steps run inside other steps (such as
+reading the table inside calculateShape when the cache is used) are recorded with the step they ran in as their 'parent', and their times are
+included in it. The report is saved as 'runReport.json' and 'runReport.csv' next to the output files. With 'profileStages' every step is also
+run under cProfile and its statistics saved to 'profiles/<number>_<step>.prof', which can be opened with "python -m pstats" or snakeviz.
+
+Peak RSS is sampled every few milliseconds through psutil if it is installed, or '/proc/self/statm' on Linux. Where neither is available only
+the peak of the whole process so far is reported, or nothing on Windows without psutil.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+def currentRSS():
+    """
+    This function returns the resident memory of this process in bytes, or None if it can not be read.
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            return int(statm.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def maximumRSS():
+    """
+    This function returns the peak resident memory of this process since it started in bytes, or None if it can not be read.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak*1024
+
+
+class MemorySampler:
+    """
+    Background thread keeping the highest RSS seen every 'interval' seconds.
+    """
+
+    def __init__(self,interval=0.005):
+        self.interval = interval
+        self.peak = currentRSS()
+        self._stop = threading.Event()
+        self._thread = None
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, currentRSS())
+
+    def stop(self):
+        """
+        This function stops the sampling and returns the highest RSS seen in bytes, or None if the RSS can not be read.
+        """
+        if self._thread is None:
+            return maximumRSS()
+        self._stop.set()
+        self._thread.join()
+
+        return max(self.peak, currentRSS())
+
+
+class RunReport:
+    """
+    Records of the steps of a run, saved in 'outputDirectory'. If 'profileStages' is True every step is also run under cProfile.
+    """
+
+    def __init__(self,outputDirectory,profileStages=False,settings=None):
+        self.outputDirectory = outputDirectory
+        self.profileStages = profileStages
+        self.settings = settings or {}
+        self.stages = []
+        self._running = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self,name,rowsIn=None):
+        """
+        Record the step run inside the 'with' block. The record is given to the block as a dictionary, so that e.g. its 'rowsOut' can be set.
+        """
+        record = {'stage': name, 'parent': self._running[-1]['stage'] if self._running else None, 'rowsIn': rowsIn, 'rowsOut': None}
+        number = len(self.stages)+1
+        self.stages.append(record)
+        self._running.append(record)
+        profiler = None
+        #only one profiler can run at a time, the steps run inside another step are in its profile
+        if self.profileStages and len(self._running) == 1:
+            import cProfile
+            profiler = cProfile.Profile()
+        sampler = MemorySampler()
+        children = os.times()
+        wallStart, cpuStart = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record['wallSeconds'] = time.perf_counter()-wallStart
+            finished = os.times()
+            record['cpuSeconds'] = (time.process_time()-cpuStart + finished.children_user-children.children_user
+                                    + finished.children_system-children.children_system)
+            peak = sampler.stop()
+            record['peakRSSMB'] = peak/1e6 if peak is not None else None
+            self._running.pop()
+            if profiler is not None:
+                profileDirectory = os.path.join(self.outputDirectory, 'profiles')
+                os.makedirs(profileDirectory, exist_ok=True)
+                profiler.dump_stats(os.path.join(profileDirectory, f'{number:02d}_{name}.prof'))
+
+    def run(self,name,function,*args,rowsIn=None):
+        """
+        Run function(*args) as the step 'name'. The number of rows out is the length of the result.
+
+        This function returns the result of the step.
+        """
+        with self.stage(name, rowsIn) as record:
+            result = function(*args)
+            if hasattr(result, '__len__') and not isinstance(result, str):
+                record['rowsOut'] = len(result)
+
+        return result
+
+    def table(self):
+        """
+        This function returns the records of all steps as a dataframe, in the order they were started.
+        """
+        table = pd.DataFrame(self.stages, columns=['stage','parent','wallSeconds','cpuSeconds','peakRSSMB','rowsIn','rowsOut'])
+
+        return table.astype({'rowsIn': 'Int64', 'rowsOut': 'Int64'})
+
+    def save(self):
+        """
+        Save the report as 'runReport.json' and 'runReport.csv' in the output directory and print it.
+
+        This function returns the names of the two files.
+        """
+        table = self.table()
+        print(table.to_string(index=False, float_format=lambda value: f'{value:.3f}'))
+        jsonFileName = os.path.join(self.outputDirectory, 'runReport.json')
+        csvFileName = os.path.join(self.outputDirectory, 'runReport.csv')
+        report = {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                  'totalSeconds': time.perf_counter()-self._start,
+                  'peakRSSMB': (maximumRSS() or 0)/1e6 or None,
+                  'settings': self.settings,
+                  'stages': self.stages}
+        with open(jsonFileName, 'w') as jsonFile:
+            json.dump(report, jsonFile, indent=2, default=str)
+        table.to_csv(csvFileName, index=False, header=True)
+
+        return jsonFileName, csvFileName
@@ -4,6 +4,7 @@ Author: johnmallon
 This script will load in a '.tif' stack, split each frame into individual images and save those images to same directory as the stack. Omnipose works on single images and not stacks which is why we need to do this.
 
 This script should be run in the imageJ macro window.
+'splitTimelapse.py' does the same from a terminal without Fiji, reading the stack one frame at a time.
 """
 from ij import IJ, ImagePlus
 import os
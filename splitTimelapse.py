@@ -0,0 +1,103 @@
+"""
+Splitting of timelapse '.tif' stacks into the single frames Omnipose segments, from a terminal instead of Fiji.
+
+'splitStacks.py' opens the whole stack in Fiji and saves every slice from there, so a stack of several GB needs as much of Fiji's memory. Here
+the stack is read one frame at a time (memory-mapped when the '.tif' layout allows it, see trackOverlay.readFrames) and the frames are written
+by a pool of threads, with only a few frames waiting to be written at once. Memory use stays the same however long the timelapse is.
+
+Every frame is saved as '<frame>.tif', numbered from 1 and padded with zeros to the same width (e.g. '001.tif' to '250.tif'), so the frames
+sort in order by name and Omnipose's outlines ('001_cp_outlines.txt') are put back in order by outlineMasks.frameNumber. With one stack in the
+folder the frames are saved next to it like 'splitStacks.py' does. With several, the frames of each stack go in a folder named after it.
+
+Run it with e.g.:
+    python splitTimelapse.py --directory "C:\\Users\\bisso\\Desktop\\omniposeAnalysis"
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import tifffile
+from tqdm import tqdm
+
+from trackOverlay import countFrames, readFrames
+
+
+def findStacks(directory):
+    """
+    This function returns the paths of the '.tif' files in 'directory' that hold more than one frame, sorted by name. Single frames, e.g. the
+    ones saved by an earlier split, are left out.
+    """
+    fileNames = [os.path.join(directory, fileName) for fileName in sorted(os.listdir(directory))
+                 if fileName.lower().endswith(('.tif', '.tiff'))]
+
+    return [fileName for fileName in fileNames if countFrames(fileName)[0] > 1]
+
+
+def frameFileNames(nFrames,outputDirectory):
+    """
+    This function returns the names the frames of a stack of 'nFrames' are saved as: '<frame>.tif' in 'outputDirectory', numbered from 1 and
+    padded with zeros so they sort in order.
+    """
+    digits = len(str(nFrames))
+
+    return [os.path.join(outputDirectory, f'{frame:0{digits}d}.tif') for frame in range(1, nFrames+1)]
+
+
+def splitStack(fileName,outputDirectory=None,workers=4):
+    """
+    Save every frame of the '.tif' stack 'fileName' as its own '.tif' file in 'outputDirectory', by default the folder of the stack. The frames
+    are read one at a time and written by 'workers' threads.
+
+    This function returns the names of the files saved, in the order of the frames.
+    """
+    outputDirectory = outputDirectory or os.path.dirname(os.path.abspath(fileName))
+    os.makedirs(outputDirectory, exist_ok=True)
+    nFrames = countFrames(fileName)[0]
+    fileNames = frameFileNames(nFrames, outputDirectory)
+    workers = workers or os.cpu_count()
+
+    with ThreadPoolExecutor(workers) as pool:
+        pending = deque()
+        for frame, frameFileName in zip(tqdm(readFrames(fileName), total=nFrames), fileNames):
+            pending.append(pool.submit(tifffile.imwrite, frameFileName, frame))
+            #only keep a couple of frames per thread waiting to be written
+            if len(pending) >= 2*workers:
+                pending.popleft().result()
+        while pending:
+            pending.popleft().result()
+
+    return fileNames
+
+
+def splitStacks(directory,workers=4):
+    """
+    Split every stack of more than one frame in 'directory' (see findStacks). The frames of a lone stack are saved in 'directory', those of
+    several stacks in a folder named after each stack.
+
+    This function returns a dictionary with the names of the files saved for every stack.
+    """
+    stacks = findStacks(directory)
+    if not stacks:
+        raise FileNotFoundError(f"No '.tif' stacks in {directory}")
+    savedFiles = {}
+    for fileName in stacks:
+        outputDirectory = directory if len(stacks) == 1 else os.path.splitext(fileName)[0]
+        savedFiles[fileName] = splitStack(fileName, outputDirectory, workers)
+
+    return savedFiles
+
+
+def main(arguments=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Split every '.tif' stack of a folder into single frames for Omnipose, without Fiji.")
+    parser.add_argument('--directory', required=True, help="folder holding the '.tif' stacks, e.g. the Omnipose_Analysis folder")
+    parser.add_argument('--workers', type=int, default=4, help='number of threads writing frames, 0 for one per CPU')
+    parsed = parser.parse_args(arguments)
+
+    for fileName, fileNames in splitStacks(parsed.directory, parsed.workers).items():
+        print(f'{len(fileNames)} frames of {fileName} saved to {os.path.dirname(fileNames[0])}')
+
+if __name__ == '__main__':
+    main()
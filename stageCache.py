@@ -0,0 +1,200 @@
+"""
+Cache of the results of each step of CP_analysis, so re-runs only redo the steps whose inputs changed.
+
+Each step (reading the table, calculateShape, stitching, finding parents, assigning foci and drawing the overlay) saves its result in the cache
+folder under a key made from the content hash of the input files it depends on and the settings it uses. Running the analysis again with e.g.
+only different output columns or a new overlay loads every other step from the cache instead of running it. The hash of every input file is
+remembered together with its size and modification time, so unchanged files are only read once.
+
+The cache is kept below a size limit by deleting the results that were used the longest time ago. It can be looked at or cleared with e.g.:
+    python stageCache.py --cacheDirectory cache
+    python stageCache.py --cacheDirectory cache --clear --stage overlay
+Results made by an older version of the analysis code are not detected, so clear the cache after updating it.
+"""
+
+import os
+import json
+import shutil
+import pickle
+import hashlib
+
+import pandas as pd
+
+
+#change this when the saved results are no longer compatible, so old results are never loaded
+cacheVersion = 1
+fileHashesName = 'fileHashes.json'
+
+
+class StageCache:
+    """
+    Results of the steps of the analysis saved in 'directory', which is limited to 'maxMB' megabytes. If 'directory' is None nothing is saved
+    or loaded and every step is always run.
+    """
+
+    def __init__(self,directory=None,maxMB=2000):
+        self.directory = directory
+        self.maxBytes = int(maxMB*1e6)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def fileHash(self,fileName):
+        """
+        This function returns the content hash of a file, or '' if the cache is off. Hashes are remembered by path, size and modification time.
+        """
+        if not self.directory:
+            return ''
+        fileName = os.path.abspath(fileName)
+        stat = os.stat(fileName)
+        hashesFileName = os.path.join(self.directory, fileHashesName)
+        try:
+            with open(hashesFileName, 'r') as hashesFile:
+                fileHashes = json.load(hashesFile)
+        except (OSError, ValueError):
+            fileHashes = {}
+        size, modified, digest = fileHashes.get(fileName, (None, None, None))
+        if size == stat.st_size and modified == stat.st_mtime_ns:
+            return digest
+
+        fileDigest = hashlib.blake2b(digest_size=16)
+        with open(fileName, 'rb') as inputFile:
+            for block in iter(lambda: inputFile.read(1 << 23), b''):
+                fileDigest.update(block)
+        digest = fileDigest.hexdigest()
+        fileHashes[fileName] = (stat.st_size, stat.st_mtime_ns, digest)
+        self._replace(hashesFileName, lambda hashesFile: hashesFile.write(json.dumps(fileHashes).encode()))
+
+        return digest
+
+    def key(self,stage,parts):
+        """
+        This function returns the name of the cache entry of a step, made from the name of the step and everything its result depends on.
+        """
+        digest = hashlib.blake2b(repr((cacheVersion, stage, tuple(parts))).encode(), digest_size=16).hexdigest()
+
+        return f'{stage}-{digest}'
+
+    def run(self,stage,parts,function,*args):
+        """
+        Load the result of a step from the cache, or run function(*args) and save its result when it is not in the cache. 'parts' are the
+        file hashes and settings the result depends on.
+
+        This function returns the result of the step.
+        """
+        if not self.directory:
+            return function(*args)
+        fileName = os.path.join(self.directory, self.key(stage, parts)+'.pkl')
+        if os.path.exists(fileName):
+            print(f'Loading {stage} from the cache...')
+            with open(fileName, 'rb') as entry:
+                result = pickle.load(entry)
+            os.utime(fileName)
+            return result
+
+        result = function(*args)
+        self._replace(fileName, lambda entry: pickle.dump(result, entry, protocol=pickle.HIGHEST_PROTOCOL))
+        self.evict()
+
+        return result
+
+    def runFile(self,stage,parts,outputFileName,function,*args):
+        """
+        The same as run() for steps that save a file, 'outputFileName', instead of returning a result. The file is copied into the cache and
+        copied back to 'outputFileName' when the step is not run again.
+        """
+        if not self.directory:
+            function(*args)
+            return
+        fileName = os.path.join(self.directory, self.key(stage, parts)+os.path.splitext(outputFileName)[1])
+        if os.path.exists(fileName):
+            print(f'Loading {stage} from the cache...')
+            shutil.copyfile(fileName, outputFileName)
+            os.utime(fileName)
+            return
+
+        function(*args)
+
+        def copyOutput(entry):
+            with open(outputFileName, 'rb') as outputFile:
+                shutil.copyfileobj(outputFile, entry)
+
+        self._replace(fileName, copyOutput)
+        self.evict()
+
+    def _replace(self,fileName,write):
+        #write to a temporary file first so that other processes never load a half written entry
+        temporaryFileName = f'{fileName}.{os.getpid()}.tmp'
+        with open(temporaryFileName, 'wb') as temporaryFile:
+            write(temporaryFile)
+        os.replace(temporaryFileName, fileName)
+
+    def entries(self):
+        """
+        This function returns a dataframe of the cache entries with their step, size and the time they were last used, most recent first.
+        """
+        rows = []
+        if self.directory and os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name != fileHashesName and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    rows.append({'Entry': entry.name, 'Stage': entry.name.split('-', 1)[0], 'Size (MB)': stat.st_size/1e6,
+                                 'Last Used': pd.Timestamp(stat.st_mtime, unit='s')})
+        entries = pd.DataFrame(rows, columns=['Entry','Stage','Size (MB)','Last Used'])
+
+        return entries.sort_values(by='Last Used', ascending=False, ignore_index=True)
+
+    def evict(self):
+        """
+        Delete the entries that were used the longest time ago until the cache is below its size limit. The most recent entry is always kept.
+        """
+        entries = self.entries()
+        sizes = (entries['Size (MB)']*1e6).to_numpy()
+        overLimit = sizes.cumsum() > self.maxBytes
+        overLimit[:1] = False
+        for name in entries['Entry'][overLimit]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def clear(self,stage=None):
+        """
+        Delete every entry of the cache, or only the entries of 'stage'.
+
+        This function returns the number of entries deleted.
+        """
+        entries = self.entries()
+        if stage is not None:
+            entries = entries[entries['Stage'] == stage]
+        for name in entries['Entry']:
+            os.remove(os.path.join(self.directory, name))
+        if stage is None and os.path.exists(os.path.join(self.directory, fileHashesName)):
+            os.remove(os.path.join(self.directory, fileHashesName))
+
+        return len(entries)
+
+
+def main(arguments=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Look at or clear the cache of CP_analysis.')
+    parser.add_argument('--cacheDirectory', required=True, help='cache folder given to CP_analysis')
+    parser.add_argument('--clear', action='store_true', help='delete the cache entries')
+    parser.add_argument('--stage', help='only clear the entries of this step, e.g. overlay')
+    parsed = parser.parse_args(arguments)
+
+    cache = StageCache(parsed.cacheDirectory)
+    if parsed.clear:
+        print(f'Deleted {cache.clear(parsed.stage)} cache entries')
+        return
+    entries = cache.entries()
+    if len(entries) == 0:
+        print('The cache is empty')
+        return
+    print(entries.to_string(index=False))
+    stages = entries.groupby('Stage')['Size (MB)'].agg(['count','sum'])
+    print(stages.rename(columns={'count': 'Entries', 'sum': 'Size (MB)'}).to_string())
+    print(f"{len(entries)} entries, {entries['Size (MB)'].sum():.1f} MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""
+Synthetic CellProfiler tables for testing and benchmarking CP_analysis without a microscope.
+
+generateTables() simulates cells growing, moving and dividing over a timelapse and writes out what CellProfiler's TrackObjects and
+RelateObjects modules would: a 'FilterCells.csv' with the 'TrackObjects_*' columns and a 'foci.csv' whose foci point to their cell through
+'Parent_FilterCells'. Every division gives one daughter a 'TrackObjects_LinkType' of 2 and the other a 1 with the same parent, and some of the
+second daughters get a new 'TrackObjects_Label' the way CellProfiler does. Object numbers are given top to bottom and left to right within every
+frame. The cell table holds every CellProfiler column of the default 'outputCellColumnOrder' of 'CP_analysis_Version_006.py'. A blank '.tif'
+stack of the same field can also be made for the tracking overlay.
+
+Run it with e.g.:
+    python syntheticData.py --outputDirectory synthetic --cells 200 --frames 100 --divisionRate 0.02
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def expectedObjects(nCells,nFrames,divisionRate,lossRate=0.0):
+    """
+    This function returns the number of rows generateTables is expected to make on average.
+    """
+    growth = (1+divisionRate)*(1-lossRate)
+
+    return nCells*np.sum(growth**np.arange(nFrames))
+
+
+def cellsForObjects(nObjects,nFrames,divisionRate,lossRate=0.0):
+    """
+    This function returns the number of starting cells needed for generateTables to make about 'nObjects' rows.
+    """
+    return max(int(round(nObjects/expectedObjects(1, nFrames, divisionRate, lossRate))), 1)
+
+
+def generateTables(nCells=100,nFrames=50,divisionRate=0.02,lossRate=0.0,newLabelFraction=0.5,fociPerCell=1.0,fieldSize=512,
+                   extraColumns=20,seed=0):
+    """
+    Simulate 'nCells' cells for 'nFrames' frames. Every frame each cell divides with a chance of 'divisionRate' and is lost from tracking with a
+    chance of 'lossRate'. 'newLabelFraction' of the daughters with a 'TrackObjects_LinkType' of 1 start a new lineage label. Cells have on
+    average 'fociPerCell' foci. 'extraColumns' columns of random measurements are added so the tables are about as wide as real CellProfiler
+    exports.
+
+    This function returns the cell table and the foci table as two dataframes.
+    """
+    rng = np.random.default_rng(seed)
+    label = np.arange(1, nCells+1)
+    x = rng.uniform(0, fieldSize, nCells)
+    y = rng.uniform(0, fieldSize, nCells)
+    area = rng.uniform(150, 300, nCells)
+    objectNumber = np.zeros(nCells, dtype=np.int64)
+    nextLabel = nCells+1
+
+    frames = []
+    for imageNumber in range(1, nFrames+1):
+        if imageNumber == 1:
+            linkType = np.zeros(nCells, dtype=np.int64)
+            parentImageNumber = np.zeros(nCells, dtype=np.int64)
+            parentObjectNumber = np.zeros(nCells, dtype=np.int64)
+        else:
+            kept = rng.random(len(label)) >= lossRate
+            label, x, y, area, objectNumber = label[kept], x[kept], y[kept], area[kept], objectNumber[kept]
+            dividing = rng.random(len(label)) < divisionRate
+            nDividing = int(dividing.sum())
+
+            #the first daughter keeps the place of the mother, the second one is added after all the cells
+            daughterLabel = label[dividing].copy()
+            newLabels = rng.random(nDividing) < newLabelFraction
+            daughterLabel[newLabels] = np.arange(nextLabel, nextLabel+newLabels.sum())
+            nextLabel += int(newLabels.sum())
+            angle = rng.uniform(0, np.pi, nDividing)
+            offset = np.sqrt(area[dividing]/np.pi)/2
+            area[dividing] /= 2
+            daughterX = x[dividing] + offset*np.cos(angle)
+            daughterY = y[dividing] + offset*np.sin(angle)
+            x[dividing] -= offset*np.cos(angle)
+            y[dividing] -= offset*np.sin(angle)
+
+            linkType = np.concatenate([np.where(dividing, 2, 1), np.ones(nDividing, dtype=np.int64)])
+            parentImageNumber = np.full(len(linkType), imageNumber-1)
+            parentObjectNumber = np.concatenate([objectNumber, objectNumber[dividing]])
+            label = np.concatenate([label, daughterLabel])
+            x = np.concatenate([x, daughterX])
+            y = np.concatenate([y, daughterY])
+            area = np.concatenate([area, area[dividing]])
+
+            #cells grow, wander and stay inside the field of view
+            area *= np.exp(rng.normal(0.02, 0.005, len(area)))
+            x = np.clip(x + rng.normal(0, 1, len(x)), 0, fieldSize-1)
+            y = np.clip(y + rng.normal(0, 1, len(y)), 0, fieldSize-1)
+
+        #CellProfiler numbers the objects of a frame from the top left to the bottom right
+        order = np.lexsort((x, np.floor(y)))
+        label, x, y, area = label[order], x[order], y[order], area[order]
+        linkType, parentImageNumber, parentObjectNumber = linkType[order], parentImageNumber[order], parentObjectNumber[order]
+        objectNumber = np.arange(1, len(label)+1)
+        frames.append(pd.DataFrame({'ImageNumber': imageNumber, 'ObjectNumber': objectNumber,
+                                    'TrackObjects_Label': label, 'TrackObjects_LinkType': linkType,
+                                    'TrackObjects_ParentImageNumber': parentImageNumber,
+                                    'TrackObjects_ParentObjectNumber': parentObjectNumber,
+                                    'AreaShape_Area': np.round(area), 'Location_Center_X': x, 'Location_Center_Y': y}))
+    cells = pd.concat(frames, ignore_index=True)
+
+    nRows = len(cells)
+    aspectRatio = rng.uniform(1, 4, nRows)
+    cells['AreaShape_MinorAxisLength'] = np.sqrt(4*cells['AreaShape_Area']/(np.pi*aspectRatio))
+    cells['AreaShape_MajorAxisLength'] = cells['AreaShape_MinorAxisLength']*aspectRatio
+    cells['AreaShape_Solidity'] = rng.uniform(0.85, 1, nRows)
+    cells['AreaShape_FormFactor'] = rng.uniform(0.5, 0.95, nRows)
+    cells['Intensity_IntegratedIntensity_GFPinCells'] = cells['AreaShape_Area']*rng.uniform(0.1, 0.5, nRows)
+    fociCount = rng.poisson(fociPerCell, nRows)
+    cells['Children_foci_Count'] = fociCount
+    extra = pd.DataFrame(rng.random((nRows, extraColumns)), columns=[f'Measurement_Random_{i}' for i in range(extraColumns)])
+    cells = pd.concat([cells, extra], axis=1)
+
+    #foci sit inside their cell and are numbered within each frame
+    fociCells = np.repeat(np.arange(nRows), fociCount)
+    radius = np.sqrt(cells['AreaShape_Area'].to_numpy()[fociCells]/np.pi)
+    fociImageNumber = cells['ImageNumber'].to_numpy()[fociCells]
+    firstFocus = np.searchsorted(fociImageNumber, fociImageNumber)
+    fociArea = rng.integers(3, 20, len(fociCells)).astype(np.float64)
+    foci = pd.DataFrame({'ImageNumber': fociImageNumber,
+                         'ObjectNumber': np.arange(len(fociCells)) - firstFocus + 1,
+                         'Parent_FilterCells': cells['ObjectNumber'].to_numpy()[fociCells],
+                         'AreaShape_Area': fociArea,
+                         'AreaShape_MajorAxisLength': np.sqrt(fociArea)*rng.uniform(1.1, 1.6, len(fociCells)),
+                         'AreaShape_MinorAxisLength': np.sqrt(fociArea)*rng.uniform(0.7, 1.0, len(fociCells)),
+                         'Location_Center_X': cells['Location_Center_X'].to_numpy()[fociCells] + rng.uniform(-0.5, 0.5, len(fociCells))*radius,
+                         'Location_Center_Y': cells['Location_Center_Y'].to_numpy()[fociCells] + rng.uniform(-0.5, 0.5, len(fociCells))*radius,
+                         'Intensity_IntegratedIntensity_foci': fociArea*rng.uniform(0.5, 2, len(fociCells))})
+    #the foci channel measured over the whole cell holds its foci on top of a dim background
+    cells['Intensity_IntegratedIntensity_foci'] = (cells['AreaShape_Area']*rng.uniform(0.01, 0.05, nRows)
+                                                   + np.bincount(fociCells, weights=foci['Intensity_IntegratedIntensity_foci'], minlength=nRows))
+
+    return cells, foci
+
+
+def writeTrackImage(fileName,nFrames,fieldSize=512,seed=0):
+    """
+    Save a noisy uint8 '.tif' stack of 'nFrames' frames to draw the tracks of the synthetic cells on, one frame at a time.
+    """
+    import tifffile
+
+    rng = np.random.default_rng(seed)
+    frames = (rng.integers(0, 256, (fieldSize, fieldSize), dtype=np.uint8) for i in range(nFrames))
+    tifffile.imwrite(fileName, frames, shape=(nFrames, fieldSize, fieldSize), dtype=np.uint8)
+
+
+def main(arguments=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Make synthetic FilterCells.csv and foci.csv tables to test CP_analysis with.')
+    parser.add_argument('--outputDirectory', required=True)
+    parser.add_argument('--cells', type=int, default=100, help='number of cells in the first frame')
+    parser.add_argument('--objects', type=float, help='aim for about this many rows instead of giving --cells')
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--divisionRate', type=float, default=0.02, help='chance of every cell dividing in each frame')
+    parser.add_argument('--lossRate', type=float, default=0.0, help='chance of every cell being lost from tracking in each frame')
+    parser.add_argument('--fociPerCell', type=float, default=1.0)
+    parser.add_argument('--fieldSize', type=int, default=512, help='width and height of the field of view in pixels')
+    parser.add_argument('--trackImage', action='store_true', help="also save a blank 'phase.tif' stack to draw the tracks on")
+    parser.add_argument('--seed', type=int, default=0)
+    parsed = parser.parse_args(arguments)
+
+    nCells = parsed.cells
+    if parsed.objects:
+        nCells = cellsForObjects(parsed.objects, parsed.frames, parsed.divisionRate, parsed.lossRate)
+    os.makedirs(parsed.outputDirectory, exist_ok=True)
+    cells, foci = generateTables(nCells, parsed.frames, parsed.divisionRate, parsed.lossRate, fociPerCell=parsed.fociPerCell,
+                                 fieldSize=parsed.fieldSize, seed=parsed.seed)
+    cells.to_csv(os.path.join(parsed.outputDirectory, 'FilterCells.csv'), index=False)
+    foci.to_csv(os.path.join(parsed.outputDirectory, 'foci.csv'), index=False)
+    if parsed.trackImage:
+        writeTrackImage(os.path.join(parsed.outputDirectory, 'phase.tif'), parsed.frames, parsed.fieldSize, parsed.seed)
+    print(f'{len(cells)} cells and {len(foci)} foci in {parsed.frames} frames saved to {parsed.outputDirectory}')
+
+if __name__ == '__main__':
+    main()
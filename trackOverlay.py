@@ -0,0 +1,267 @@
+"""
+Drawing of the CellProfiler tracks on top of the Omnipose segmentation, shared by 'CP_analysis_Version_006.py' and
+'CP_analysis_GUI_Version_007.py'.
+
+Each track is drawn as a polyline through the 'Location_Center_X'/'Location_Center_Y' points of a cell-through-time. Instead of plotting every
+segment through matplotlib and grabbing the rendered canvas, the lines are rasterized straight into a uint8 RGB array the size of the input
+frame and alpha blended over it, so the output is pixel-aligned with the input stack.
+
+The input stack is read one frame at a time (memory-mapped when the '.tif' layout allows it) and every drawn frame is written straight to a
+BigTIFF file, so only a few frames are ever held in memory no matter how long the movie is. Every frame only depends on the segments close to
+it in time, so the frames can also be drawn in chunks by a pool of worker processes and written back in order.
+"""
+
+import numpy as np
+import tifffile
+from tqdm import tqdm
+
+from workerPool import mapChunks
+
+
+def countFrames(fileName):
+    """
+    This function returns the number of frames in a '.tif' stack and the number of '.tif' pages each frame is stored in.
+    """
+    with tifffile.TiffFile(fileName) as tif:
+        series = tif.series[0]
+        nPages = len(series.pages)
+        if nPages <= 1 or len(series.shape) < 3:
+            return 1, max(nPages, 1)
+
+        return series.shape[0], max(nPages // series.shape[0], 1)
+
+
+def readFrames(fileName,start=0,stop=None):
+    """
+    Read the frames 'start' to 'stop' of a '.tif' stack one frame at a time. Stacks stored uncompressed in one block are memory-mapped, otherwise
+    every frame is decoded from its own page(s). When a frame is stored in several pages (one per channel) the channels are put on the last axis.
+
+    This function yields the frames as arrays, in order.
+    """
+    nFrames, pagesPerFrame = countFrames(fileName)
+    stop = nFrames if stop is None else min(stop, nFrames)
+    try:
+        stack = tifffile.memmap(fileName, mode='r')
+    except ValueError:
+        stack = None
+    if stack is not None and pagesPerFrame == 1 and nFrames > 1 and len(stack) == nFrames:
+        for frame in stack[start:stop]:
+            yield frame
+        return
+
+    with tifffile.TiffFile(fileName) as tif:
+        pages = tif.series[0].pages
+        if nFrames == 1:
+            if start == 0 and stop > 0:
+                yield tif.series[0].asarray()
+            return
+        for frame in range(start, stop):
+            if pagesPerFrame == 1:
+                yield pages[frame].asarray()
+            else:
+                yield np.stack([pages[frame*pagesPerFrame + channel].asarray() for channel in range(pagesPerFrame)], axis=-1)
+
+
+def toRGB(frame,low,high):
+    """
+    Convert a single frame of the input stack to uint8 RGB. Grayscale frames and frames that are not uint8 are scaled between 'low' and 'high',
+    the way matplotlib's imshow scales them with the range of the first frame.
+
+    This function returns the (height, width, 3) uint8 frame.
+    """
+    if frame.ndim == 3 and frame.shape[2] < 3:
+        frame = frame[:, :, 0]
+    if frame.ndim == 3 and frame.dtype == np.uint8:
+        return frame[:, :, :3]
+    scaled = (frame.astype(np.float32) - low) * (255 / max(high - low, 1e-12))
+    scaled = np.clip(scaled + 0.5, 0, 255).astype(np.uint8)
+    if scaled.ndim == 2:
+        return np.repeat(scaled[:, :, None], 3, axis=2)
+
+    return scaled[:, :, :3]
+
+
+def rasterizeSegments(shape,x0,y0,x1,y1,colors,lineWidth=1,antialias=True):
+    """
+    Rasterize the line segments from (x0, y0) to (x1, y1) into an image of the given (height, width) 'shape'. Every segment is sampled once per
+    pixel along its major axis. With 'antialias' each sample is split between the two nearest pixels across the line (Xiaolin Wu's algorithm),
+    otherwise it is rounded to the nearest pixel. Lines wider than one pixel are made by repeating the samples across the line.
+
+    This function returns the coverage (0 to 1) of every pixel as a float32 (height, width) array and the color of every pixel as a uint8
+    (height, width, 3) array. Where segments overlap the one drawn last keeps its color.
+    """
+    height, width = shape
+    coverage = np.zeros(height*width, dtype=np.float32)
+    colorLayer = np.zeros((height*width, 3), dtype=np.uint8)
+    if len(x0) == 0:
+        return coverage.reshape(height, width), colorLayer.reshape(height, width, 3)
+
+    x0, y0, x1, y1 = (np.asarray(v, dtype=np.float64) for v in (x0, y0, x1, y1))
+    steep = np.abs(y1 - y0) > np.abs(x1 - x0)
+    lengths = np.ceil(np.maximum(np.abs(x1 - x0), np.abs(y1 - y0))).astype(np.int64) + 1
+    segment = np.repeat(np.arange(len(x0)), lengths)
+    step = np.arange(len(segment)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    t = step / np.maximum(lengths[segment] - 1, 1)
+    x = x0[segment] + t*(x1 - x0)[segment]
+    y = y0[segment] + t*(y1 - y0)[segment]
+
+    steep = steep[segment]
+    major = np.rint(np.where(steep, y, x)).astype(np.int64)
+    minor = np.where(steep, x, y)
+    if antialias:
+        minorFloor = np.floor(minor)
+        fraction = (minor - minorFloor).astype(np.float32)
+        minorFloor = minorFloor.astype(np.int64)
+        major = np.concatenate([major, major])
+        minor = np.concatenate([minorFloor, minorFloor + 1])
+        weight = np.concatenate([1 - fraction, fraction])
+        segment = np.concatenate([segment, segment])
+        steep = np.concatenate([steep, steep])
+    else:
+        minor = np.rint(minor).astype(np.int64)
+        weight = np.ones(len(major), dtype=np.float32)
+
+    if lineWidth > 1:
+        offsets = np.arange(lineWidth) - (lineWidth - 1)//2
+        major = np.tile(major, lineWidth)
+        minor = (minor[None, :] + offsets[:, None]).ravel()
+        weight = np.tile(weight, lineWidth)
+        segment = np.tile(segment, lineWidth)
+        steep = np.tile(steep, lineWidth)
+
+    px = np.where(steep, minor, major)
+    py = np.where(steep, major, minor)
+    keep = (px >= 0) & (px < width) & (py >= 0) & (py < height) & (weight > 0)
+    pixels = py[keep]*width + px[keep]
+    np.maximum.at(coverage, pixels, weight[keep])
+    colorLayer[pixels] = colors[segment[keep]]
+
+    return coverage.reshape(height, width), colorLayer.reshape(height, width, 3)
+
+
+def blendOverlay(frame,coverage,colorLayer,alpha=0.8):
+    """
+    This function returns the uint8 RGB frame with the rasterized lines alpha blended on top of it.
+    """
+    opacity = (alpha*coverage)[:, :, None]
+
+    return (frame*(1 - opacity) + colorLayer*opacity + 0.5).astype(np.uint8)
+
+
+def findTrackSegments(data):
+    """
+    Find the line segments between consecutive instances of every cell-through-time, in the order the cells were tracked.
+
+    This function returns the x0, y0, x1, y1 arrays of the segments, the 'ImageNumber' of both ends and the 'Cell ID' of each segment.
+    """
+    cellIDs = data['cell ID'].to_numpy()
+    frames = data['ImageNumber'].to_numpy()
+    x = data['Location_Center_X'].to_numpy(dtype=np.float64)
+    y = data['Location_Center_Y'].to_numpy(dtype=np.float64)
+    #the rows of every cell-through-time follow each other, so a segment joins every row to the next one of the same cell
+    order = np.argsort(cellIDs, kind='stable')
+    cellIDs, frames, x, y = cellIDs[order], frames[order], x[order], y[order]
+    sameCell = cellIDs[1:] == cellIDs[:-1]
+
+    return (x[:-1][sameCell], y[:-1][sameCell], x[1:][sameCell], y[1:][sameCell],
+            frames[:-1][sameCell], frames[1:][sameCell], cellIDs[1:][sameCell])
+
+
+class SegmentIndex:
+    """
+    Table of every track segment sorted by the frame it ends in, so the segments drawn on a frame are found with a searchsorted slice instead
+    of filtering every cell. Up to frame 'historyFrames' every segment up to the current frame is drawn, after that only the segments within
+    'window' frames of the current frame.
+    """
+
+    def __init__(self,x0,y0,x1,y1,startFrames,endFrames,colors,historyFrames=10,window=3):
+        order = np.argsort(endFrames, kind='stable')
+        self.x0 = np.asarray(x0, dtype=np.float32)[order]
+        self.y0 = np.asarray(y0, dtype=np.float32)[order]
+        self.x1 = np.asarray(x1, dtype=np.float32)[order]
+        self.y1 = np.asarray(y1, dtype=np.float32)[order]
+        self.startFrames = np.asarray(startFrames, dtype=np.int32)[order]
+        self.frames = np.asarray(endFrames, dtype=np.int32)[order]
+        self.colors = np.asarray(colors, dtype=np.uint8)[order]
+        self.historyFrames = historyFrames
+        self.window = window
+        spans = self.frames - self.startFrames
+        self.minSpan = int(spans.min()) if len(spans) else 0
+        self.maxSpan = int(spans.max()) if len(spans) else 0
+
+    @classmethod
+    def fromTable(cls,data,cellColors,historyFrames=10,window=3):
+        """
+        Build the segment table from the cells-through-time dataframe, giving every segment the color 'cellColors[cellID]' of its cell.
+
+        This function returns the new SegmentIndex.
+        """
+        x0, y0, x1, y1, startFrames, endFrames, segmentCells = findTrackSegments(data)
+
+        return cls(x0, y0, x1, y1, startFrames, endFrames, cellColors[segmentCells], historyFrames, window)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def visible(self,frame):
+        """
+        This function returns the x0, y0, x1, y1 and color arrays of the segments drawn on 'frame'.
+        """
+        if frame > self.historyFrames:
+            #a segment is drawn when both of its ends are within the window, it can only end after its start plus the shortest span
+            first = np.searchsorted(self.frames, frame - self.window + self.minSpan, 'left')
+            last = np.searchsorted(self.frames, frame + self.window, 'right')
+            rows = slice(first, last)
+            if self.minSpan != self.maxSpan:
+                rows = first + np.flatnonzero(self.startFrames[rows] >= frame - self.window)
+        else:
+            rows = slice(0, np.searchsorted(self.frames, frame, 'right'))
+
+        return self.x0[rows], self.y0[rows], self.x1[rows], self.y1[rows], self.colors[rows]
+
+
+def drawFrame(frame,image,low,high,segmentIndex,lineWidth=1,antialias=True,alpha=0.8):
+    """
+    Draw the track segments of 'segmentIndex' that are visible in one frame on top of it.
+
+    This function returns the drawn uint8 RGB frame.
+    """
+    currentFrame = toRGB(image, low, high)
+    x0, y0, x1, y1, colors = segmentIndex.visible(frame)
+    coverage, colorLayer = rasterizeSegments(currentFrame.shape[:2], x0, y0, x1, y1, colors, lineWidth, antialias)
+
+    return blendOverlay(currentFrame, coverage, colorLayer, alpha)
+
+
+def _drawChunk(state,start,stop):
+    trackImageFileName, low, high, segmentIndex, lineWidth, antialias, alpha = state
+    for frame, image in zip(range(start, stop), readFrames(trackImageFileName, start, stop)):
+        yield drawFrame(frame, image, low, high, segmentIndex, lineWidth, antialias, alpha)
+
+
+def drawTracks(data,trackImageFileName,outputFileName,lineWidth=1,antialias=True,alpha=0.8,seed=None,workers=1,chunkSize=8,
+               historyFrames=10,window=3):
+    """
+    This function takes the X,Y center points of instances of cells-through-time and draws lines between them on top of the original
+    segmentation '.tif' generated from Omnipose. Every cell-through-time gets its own random color. For the first 'historyFrames' frames every
+    segment up to the current frame is drawn, after that only the segments within 'window' frames of the current frame.
+
+    With 'workers' above 1 (or 0/None for one per CPU) the frames are drawn by a pool of processes, 'chunkSize' frames at a time, and written in
+    order (see workerPool.py).
+
+    This function saves a new BigTIFF '.tif' stack, the same size as the input stack, with the tracks visualized and returns nothing. Frames
+    are read, drawn and written one at a time.
+    """
+    rng = np.random.default_rng(seed)
+    cellColors = rng.integers(0, 256, size=(int(data['cell ID'].max()) + 1, 3), dtype=np.uint8)
+    segmentIndex = SegmentIndex.fromTable(data, cellColors, historyFrames, window)
+
+    nFrames = countFrames(trackImageFileName)[0]
+    firstFrame = next(readFrames(trackImageFileName, 0, 1))
+    low, high = float(firstFrame.min()), float(firstFrame.max())
+    height, width = firstFrame.shape[:2]
+    print((nFrames,)+firstFrame.shape)
+    state = (trackImageFileName, low, high, segmentIndex, lineWidth, antialias, alpha)
+    frames = mapChunks(_drawChunk, nFrames, state, workers, chunkSize)
+    tifffile.imwrite(outputFileName, iter(tqdm(frames, total=nFrames)), shape=(nFrames, height, width, 3), dtype=np.uint8, photometric='rgb',
+                     bigtiff=True)
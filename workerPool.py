@@ -0,0 +1,52 @@
+"""
+Ordered chunked process pool shared by 'trackOverlay.py', 'outlineMasks.py' and 'imagejRois.py'.
+
+The frames of a stack are cut into chunks of a few frames that worker processes make one chunk at a time. The state every frame needs (file
+names, settings, indexes) is sent to each worker once when it starts instead of with every chunk, and the chunks are handed back in order so the
+frames can be written straight to the output file. Only a couple of chunks per worker are ever waiting, so memory use does not grow with the
+number of frames.
+
+Scripts that use more than one worker must only start under "if __name__ == '__main__':", since every worker imports the script again.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+#state of the running worker process, made once by _startWorker
+_workerState = None
+
+
+def _startWorker(state,openState):
+    global _workerState
+    _workerState = openState(state) if openState is not None else state
+
+
+def _runChunk(chunkFunction,start,stop):
+    return list(chunkFunction(_workerState, start, stop))
+
+
+def mapChunks(chunkFunction,nItems,state,workers=1,chunkSize=8,openState=None):
+    """
+    Run chunkFunction(state, start, stop), which yields the results of the items 'start' to 'stop', over all 'nItems' items. With 'workers'
+    above 1 (or 0/None for one per CPU) the chunks of 'chunkSize' items are run by a pool of processes, otherwise everything is run here as one
+    chunk. 'openState', if given, turns 'state' into what chunkFunction is given once in every process, for things that should be opened there
+    rather than sent (e.g. memory-mapped files). 'chunkFunction' and 'openState' must be functions at the top level of a module.
+
+    This function yields the results of every item, in order.
+    """
+    workers = workers or os.cpu_count()
+    if workers <= 1 or nItems <= chunkSize:
+        yield from chunkFunction(openState(state) if openState is not None else state, 0, nItems)
+        return
+
+    with ProcessPoolExecutor(workers, initializer=_startWorker, initargs=(state, openState)) as pool:
+        pending = deque()
+        for start in range(0, nItems, chunkSize):
+            pending.append(pool.submit(_runChunk, chunkFunction, start, min(start+chunkSize, nItems)))
+            #only keep a couple of chunks per worker in memory at once
+            if len(pending) >= 2*workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()